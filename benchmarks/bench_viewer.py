@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Benchmarks of the viewer's hot paths: opening a list, populating the
+table, showing the next image and saving tags.
+
+Runs under the offscreen Qt platform. Synthetic lists (create_tsv.py's
+3-column format) and images of several sizes are generated once under
+``--data``. Every run is stored in ``--results`` and compared with the
+baseline there; a timing that got more than ``--tolerance`` times slower
+fails the run.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+from label_data import list_sep
+from line_index import index_path_for
+from list_sidecar import sidecar_path_for
+from tag_journal import TagJournal
+
+DEFAULT_ROWS = [1000, 100_000, 1_000_000]
+# (name, width, height) of the synthetic images
+IMAGE_SIZES = [("small", 800, 600), ("medium", 2000, 1500), ("large", 6000, 4000)]
+PREDS = [f"class_{i:02d}" for i in range(20)]
+
+# differences below this are noise, whatever the ratio (seconds, or MB
+# for memory)
+MIN_REGRESSION = 0.005
+
+
+def make_images(directory, width, height, count, seed=0):
+    """JPEGs with smooth gradients and some noise, so that they compress
+    (and decode) like photos rather than like random pixels."""
+    import cv2
+
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f"{i:03d}.jpg") for i in range(count)]
+    if all(os.path.exists(p) for p in paths):
+        return paths
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    for i, path in enumerate(paths):
+        phase = rng.uniform(0, 2 * np.pi, 3)
+        channels = [
+            127 + 100 * np.sin(x / (width / (2 + i + c)) + y / (height / 3) + phase[c])
+            for c in range(3)
+        ]
+        image = np.dstack(channels) + rng.normal(0, 8, (height, width, 3))
+        cv2.imwrite(path, np.clip(image, 0, 255).astype(np.uint8),
+                    [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return paths
+
+
+def make_list(filename, rows, images, seed=0):
+    """A ``rows``-row list (filename, pred., conf. score) cycling over
+    ``images``."""
+    if os.path.exists(filename):
+        return filename
+    rng = np.random.default_rng(seed)
+    preds = rng.choice(PREDS, rows)
+    scores = rng.random(rows)
+    tmp = f"{filename}.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=list_sep(filename), lineterminator="\n")
+        writer.writerows(
+            (images[i % len(images)], preds[i], f"{scores[i]:.4f}") for i in range(rows)
+        )
+    os.replace(tmp, filename)
+    return filename
+
+
+def fresh_copy(filename, directory):
+    """Untouched copy of a generated list, without sidecar, line index or
+    journal (opening and closing a list rewrites it)."""
+    copy = os.path.join(directory, os.path.basename(filename))
+    for path in (copy, sidecar_path_for(copy), index_path_for(copy), TagJournal.path_for(copy)):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.copyfile(filename, copy)
+    return copy
+
+
+def wait_until(app, done, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("viewer did not finish in time")
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+def bench_list(viewer, filename, rows, work_dir, tags, rng):
+    results = {}
+    name = f"{rows} rows"
+    path = fresh_copy(filename, work_dir)
+
+    viewer.metrics.histograms.clear()
+    t0 = time.perf_counter()
+    viewer.openList(path)
+    results[f"open (text) {name}"] = time.perf_counter() - t0
+    results[f"populate {name}"] = viewer.metrics.histograms["populate"].total
+    viewer.labels.wait_sidecar()
+
+    positions = rng.integers(0, len(viewer.metadata), tags)
+    samples = []
+    for position in positions:
+        t0 = time.perf_counter()
+        viewer.saveTags([int(position)], "맞")
+        samples.append(time.perf_counter() - t0)
+    results[f"tag {name}"] = statistics.median(samples)
+    t0 = time.perf_counter()
+    viewer.syncJournal()
+    results[f"journal sync {name}"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    viewer.exportList()
+    results[f"export {name}"] = time.perf_counter() - t0
+
+    viewer.closeJournal()
+    t0 = time.perf_counter()
+    viewer.openList(path)
+    results[f"open (sidecar) {name}"] = time.perf_counter() - t0
+    # compared like the timings, so a bigger frame fails the run too; paths
+    # are only compacted from the sidecar on (see label_data.read_list)
+    results[f"metadata MB {name}"] = viewer.metadata.memory_usage(deep=True).sum() / 2**20
+    viewer.closeJournal()
+
+    # the same list streamed from disk (see line_index)
+    path = fresh_copy(filename, work_dir)
+    t0 = time.perf_counter()
+    viewer.openList(path, streaming=True)
+    results[f"open (stream) {name}"] = time.perf_counter() - t0
+    samples = []
+    for position in rng.integers(0, len(viewer.labels), tags):
+        t0 = time.perf_counter()
+        viewer.saveTags([int(position)], "맞")
+        samples.append(time.perf_counter() - t0)
+    results[f"tag (stream) {name}"] = statistics.median(samples)
+    t0 = time.perf_counter()
+    viewer.exportList()
+    results[f"export (stream) {name}"] = time.perf_counter() - t0
+    viewer.closeJournal()
+    return results
+
+
+def bench_show_next(app, viewer, filename, work_dir, label):
+    """Latency of Next from the press until the image is on screen; the
+    first image is decoded cold, the others were prefetched meanwhile."""
+    viewer.imageCache.clear()
+    viewer.openList(fresh_copy(filename, work_dir))
+    samples = []
+    for _ in range(len(viewer.metadata)):
+        t0 = time.perf_counter()
+        viewer.showNext()
+        wait_until(app, lambda: viewer.show_started is None)
+        samples.append(time.perf_counter() - t0)
+        # give the prefetch the time a labeler would take to decide
+        deadline = time.perf_counter() + 0.2
+        wait_until(app, lambda: time.perf_counter() > deadline)
+    viewer.closeJournal()
+    return {
+        f"show first {label}": samples[0],
+        f"show next {label}": statistics.median(samples[1:]),
+        f"show next p95 {label}": float(np.percentile(samples[1:], 95)),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Timings that regressed against ``baseline``: (name, old, new)."""
+    return [
+        (name, baseline[name], seconds)
+        for name, seconds in results.items()
+        if name in baseline
+        and seconds > baseline[name] * tolerance
+        and seconds - baseline[name] > MIN_REGRESSION
+    ]
+
+
+def parse_args():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark the viewer's hot paths.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="list sizes to open, tag and export")
+    parser.add_argument("--data", default=os.path.join(here, "data"),
+                        help="directory of the generated images and lists (kept across runs)")
+    parser.add_argument("--results", default=os.path.join(here, "results"),
+                        help="directory of the stored results")
+    parser.add_argument("--baseline",
+                        help="results to compare with (default: <results>/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.3,
+                        help="slowdown factor that counts as a regression")
+    parser.add_argument("--tags", type=int, default=200, help="tags saved per list")
+    parser.add_argument("--images", type=int, default=12,
+                        help="images per size walked with Next")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    import viewer as viewer_module
+
+    work_dir = os.path.join(args.data, "work")
+    os.makedirs(work_dir, exist_ok=True)
+    image_lists = []
+    for label, width, height in IMAGE_SIZES:
+        images = make_images(os.path.join(args.data, label), width, height, args.images)
+        image_lists.append((label, images, make_list(
+            os.path.join(args.data, f"show-{label}.txt"), len(images), images
+        )))
+    # large lists only need to be opened, not shown
+    lists = [
+        (make_list(os.path.join(args.data, f"list-{rows}.txt"), rows, image_lists[0][1]), rows)
+        for rows in args.rows
+    ]
+
+    viewer = viewer_module.QImageViewer(
+        thumbnail_cache=os.path.join(args.data, "thumbnails.sqlite")
+    )
+    viewer.resize(1280, 900)
+    viewer.show()
+    app.processEvents()
+
+    results = {}
+    rng = np.random.default_rng(0)
+    try:
+        for filename, rows in lists:
+            results.update(bench_list(viewer, filename, rows, work_dir, args.tags, rng))
+        for label, _, filename in image_lists:
+            results.update(bench_show_next(app, viewer, filename, work_dir, label))
+    finally:
+        viewer.thumbnailLoader.shutdown()
+        viewer.imageLoader.shutdown()
+        viewer.closeJournal()
+
+    run = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    os.makedirs(args.results, exist_ok=True)
+    with open(os.path.join(args.results, f"{run['time'].replace(':', '')}.json"), "w") as f:
+        json.dump(run, f, indent=1)
+
+    baseline_path = args.baseline or os.path.join(args.results, "baseline.json")
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+
+    print(f"{'benchmark':<36}{'value':>10}{'baseline':>10}")
+    for name, value in results.items():
+        # timings are stored in seconds and shown in ms
+        scale, unit = (1, "MB") if " MB " in name else (1000, "ms")
+        old = f"{baseline[name] * scale:10.2f}" if baseline and name in baseline else " " * 10
+        print(f"{name:<36}{value * scale:10.2f}{old} {unit}")
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(run, f, indent=1)
+        print(f"saved as baseline: {baseline_path}")
+    elif baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.4g} -> {new:.4g}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import math
+from collections import OrderedDict
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt, QObject, QPointF, QRect, QRectF, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QPixmap
+from PyQt5.QtWidgets import QGridLayout, QSizePolicy, QWidget
+
+from image_loader import native_size
+
+MAX_PANES = 4
+MIN_ZOOM = 0.25
+MAX_ZOOM = 64.0
+
+# panes are painted from TILE x TILE pixmaps rendered at the current zoom;
+# panning only renders the tiles that scroll into view
+TILE = 256
+# tiles kept per pane (~256 KB each)
+TILE_CACHE = 256
+
+# decode targets are rounded up to this step, like the single image view
+TARGET_STEP = 128
+
+
+class ZoomState(QObject):
+    """Zoom and pan shared by all panes.
+
+    ``zoom`` is relative to the size at which an image fits its pane, and
+    ``center`` is the point of the image (as fractions of its width and
+    height) at the pane's center, so images of different resolutions stay
+    aligned.
+    """
+
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.zoom = 1.0
+        self.center = QPointF(0.5, 0.5)
+
+    def set(self, zoom, center):
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        center = QPointF(min(1.0, max(0.0, center.x())), min(1.0, max(0.0, center.y())))
+        if zoom != self.zoom or center != self.center:
+            self.zoom = zoom
+            self.center = center
+            self.changed.emit()
+
+    def reset(self):
+        self.set(1.0, QPointF(0.5, 0.5))
+
+
+class ImagePane(QWidget):
+    """One image of the compare view, painted tile by tile.
+
+    The image may be decoded below its native resolution; tiles are
+    rendered from whatever resolution is there and re-rendered once a
+    sharper decode arrives.
+    """
+
+    def __init__(self, state: ZoomState, parent=None):
+        super().__init__(parent)
+        self.state = state
+        self.state.changed.connect(self.update)
+        self.filename = None
+        self.caption = ""
+        self.message = ""
+        self.loading = False
+        self.image = None
+        self.nativeSize = None
+        self._tiles = OrderedDict()
+        self._tile_scale = None
+        self._drag = None
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMinimumSize(64, 64)
+
+    def setFilename(self, filename, caption: str):
+        self.caption = caption
+        if filename != self.filename:
+            self.filename = filename
+            self.message = "loading..." if filename else "no image"
+            self.loading = bool(filename)
+            self._setImage(None)
+
+    def setImage(self, image):
+        self.loading = False
+        if image.isNull():
+            self.message = "cannot load"
+            self._setImage(None)
+        else:
+            self._setImage(image)
+
+    def _setImage(self, image):
+        self.image = image
+        self.nativeSize = native_size(image) if image is not None else None
+        self._tiles.clear()
+        self._tile_scale = None
+        self.update()
+
+    def fitScale(self) -> float:
+        return min(self.width() / self.nativeSize.width(),
+                   self.height() / self.nativeSize.height())
+
+    def scale(self) -> float:
+        """Display pixels per native image pixel."""
+        return self.fitScale() * self.state.zoom
+
+    def _geometry(self):
+        """(scale, scaled width, scaled height, top-left x, top-left y)."""
+        scale = self.scale()
+        width = max(1, math.ceil(self.nativeSize.width() * scale))
+        height = max(1, math.ceil(self.nativeSize.height() * scale))
+        left = round(self.width() / 2 - self.state.center.x() * width)
+        top = round(self.height() / 2 - self.state.center.y() * height)
+        return scale, width, height, left, top
+
+    def _tile(self, scale, width, height, tx, ty) -> QPixmap:
+        if scale != self._tile_scale:
+            self._tiles.clear()
+            self._tile_scale = scale
+        key = (tx, ty)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            return pixmap
+
+        x, y = tx * TILE, ty * TILE
+        w, h = min(TILE, width - x), min(TILE, height - y)
+        # decoded pixels per display pixel
+        k = self.image.width() / (self.nativeSize.width() * scale)
+        pixmap = QPixmap(w, h)
+        painter = QPainter(pixmap)
+        # smooth when shrinking; past 100% the pixels are shown as they are
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, k > 1.0)
+        painter.drawImage(QRectF(0, 0, w, h), self.image, QRectF(x * k, y * k, w * k, h * k))
+        painter.end()
+
+        self._tiles[key] = pixmap
+        if len(self._tiles) > TILE_CACHE:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().dark())
+        if self.image is not None:
+            scale, width, height, left, top = self._geometry()
+            visible = event.rect() & QRect(left, top, width, height)
+            if not visible.isEmpty():
+                for ty in range((visible.top() - top) // TILE, (visible.bottom() - top) // TILE + 1):
+                    for tx in range((visible.left() - left) // TILE,
+                                    (visible.right() - left) // TILE + 1):
+                        painter.drawPixmap(left + tx * TILE, top + ty * TILE,
+                                           self._tile(scale, width, height, tx, ty))
+
+        text = self.caption if self.image is not None else f"{self.caption}\n{self.message}"
+        bounds = painter.boundingRect(self.rect().adjusted(4, 4, -4, -4),
+                                      Qt.AlignLeft | Qt.AlignTop, text)
+        painter.fillRect(bounds.adjusted(-2, -2, 2, 2), QColor(0, 0, 0, 160))
+        painter.setPen(Qt.white)
+        painter.drawText(bounds, Qt.AlignLeft | Qt.AlignTop, text)
+
+    def resizeEvent(self, event):
+        self._tiles.clear()
+        self._tile_scale = None
+        super().resizeEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.image is not None:
+            self._drag = (event.pos(), self.state.center)
+
+    def mouseMoveEvent(self, event):
+        if self._drag is None:
+            return
+        start, center = self._drag
+        _, width, height, _, _ = self._geometry()
+        delta = event.pos() - start
+        self.state.set(self.state.zoom,
+                       QPointF(center.x() - delta.x() / width, center.y() - delta.y() / height))
+
+    def mouseReleaseEvent(self, event):
+        self._drag = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.state.reset()
+
+    def wheelEvent(self, event):
+        if self.image is None:
+            return
+        factor = 1.25 ** (event.angleDelta().y() / 120)
+        self.zoomAt(factor, event.pos())
+
+    def zoomAt(self, factor: float, pos):
+        """Zoom by ``factor`` keeping the image point under ``pos`` in place."""
+        if self.image is None:
+            self.state.set(self.state.zoom * factor, self.state.center)
+            return
+        _, width, height, left, top = self._geometry()
+        # the point under the cursor, as fractions of the image
+        u = QPointF((pos.x() - left) / width, (pos.y() - top) / height)
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, self.state.zoom * factor))
+        factor = zoom / self.state.zoom
+        offset = QPointF((pos.x() - self.width() / 2) / (width * factor),
+                         (pos.y() - self.height() / 2) / (height * factor))
+        self.state.set(zoom, u - offset)
+
+
+class CompareView(QWidget):
+    """2-4 images of one row side by side (2x2 for 4) with shared zoom and
+    pan. ``targetChanged`` fires when the panes need the images decoded at
+    another size (see ``decodeTarget``)."""
+
+    targetChanged = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.state = ZoomState(self)
+        self.state.changed.connect(self.checkTarget)
+        self.panes = [ImagePane(self.state, self) for _ in range(MAX_PANES)]
+        self.grid = QGridLayout(self)
+        self.grid.setContentsMargins(0, 0, 0, 0)
+        self.grid.setSpacing(2)
+        self.count = 0
+        self._target = None
+        self.setPaneCount(2)
+
+    def setPaneCount(self, count: int):
+        count = min(MAX_PANES, max(1, count))
+        if count == self.count:
+            return
+        self.count = count
+        columns = 2 if count == 4 else count
+        for i, pane in enumerate(self.panes):
+            self.grid.removeWidget(pane)
+            pane.setVisible(i < count)
+            if i < count:
+                self.grid.addWidget(pane, i // columns, i % columns)
+
+    def setFilenames(self, filenames, captions):
+        """Show ``filenames`` (None for a missing image) in the panes."""
+        self.setPaneCount(len(filenames))
+        for pane, filename, caption in zip(self.panes, filenames, captions):
+            pane.setFilename(filename, caption)
+
+    def setImage(self, filename, image):
+        for pane in self.panes[:self.count]:
+            if pane.filename == filename:
+                pane.setImage(image)
+        # native sizes are known now, which may lower the target
+        self.checkTarget()
+
+    def clear(self):
+        for pane in self.panes:
+            pane.setFilename(None, "")
+
+    def paneSize(self):
+        return self.panes[0].size()
+
+    def fitTarget(self):
+        size = self.paneSize()
+        step = TARGET_STEP
+        return (-(-size.width() // step) * step, -(-size.height() // step) * step)
+
+    def decodeTarget(self):
+        """Size to decode images at for the current zoom: the pane size
+        times the next power of two of the zoom, so zooming in only
+        decodes a handful of sizes. Once every image is loaded, the level
+        stops at the first one that decodes them all at native size, so
+        zooming further does not decode (and cache) them again."""
+        w, h = self.fitTarget()
+        level = 2 ** max(0, math.ceil(math.log2(self.state.zoom)))
+        panes = [pane for pane in self.panes[:self.count] if pane.filename]
+        if panes and not any(pane.loading for pane in panes):
+            sizes = [pane.nativeSize for pane in panes if pane.nativeSize is not None]
+            if sizes:
+                needed = max(max(s.width() / w, s.height() / h) for s in sizes)
+                level = min(level, 2 ** max(0, math.ceil(math.log2(needed))))
+        return (w * level, h * level)
+
+    def checkTarget(self):
+        target = self.decodeTarget()
+        if target != self._target:
+            self._target = target
+            self.targetChanged.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # once the layout has settled
+        QtCore.QTimer.singleShot(0, self.checkTarget)
+
+    def zoomBy(self, factor: float):
+        pane = self.panes[0]
+        pane.zoomAt(factor, pane.rect().center())
+
+    def actualSize(self):
+        """Zoom so that the first image is shown at 100%."""
+        pane = self.panes[0]
+        if pane.image is not None:
+            self.state.set(1.0 / pane.fitScale(), self.state.center)
+
+    def reset(self):
+        self.state.reset()
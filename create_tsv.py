@@ -1,23 +1,301 @@
 import os
-from pathlib import Path
-from glob import glob
-import pandas as pd
+import csv
+import argparse
+from collections import defaultdict
+from contextlib import nullcontext
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from label_data import list_sep
 
-image_dir = "imgs"
-# image_list = list(glob(Path(image_dir).joinpath("*").with_suffix(".jpg")))
 ext_list = ["png", "jpg", "jpeg", "bmp", "gif"]
-image_list = sum([glob(os.path.join(image_dir, f"*.{e}")) for e in ext_list], [])
-image_data = pd.DataFrame(
-    {
-        "filename": image_list,
-        "prediction": "P",
-        # "tag": ("UNK" for s in enumerate(image_list)),
-        "conf. score": (f"example_{i:0>3}" for i, s in enumerate(image_list)),
+
+# size written to the .stat sidecar for images that disappeared from disk
+MISSING = -1
+
+
+def stat_path_for(filename) -> str:
+    return f"{filename}.stat"
+
+
+def dirs_path_for(filename) -> str:
+    return f"{filename}.dirs"
+
+
+def read_table(filename, sep="\t"):
+    # blank lines are skipped, as label_data.read_list skips them
+    with open(filename, encoding="utf-8", newline="") as f:
+        yield from (row for row in csv.reader(f, delimiter=sep) if row)
+
+
+def write_table(filename, rows, sep="\t", mode="w"):
+    if mode == "a" and _lacks_final_newline(filename):
+        with open(filename, "a", encoding="utf-8", newline="") as f:
+            f.write("\n")
+    with open(filename, mode, encoding="utf-8", newline="") as f:
+        csv.writer(f, delimiter=sep, lineterminator="\n").writerows(rows)
+
+
+def _lacks_final_newline(filename) -> bool:
+    with open(filename, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def read_stat(filename) -> dict:
+    if not os.path.exists(stat_path_for(filename)):
+        return {}
+    return {
+        path: (int(size), int(mtime))
+        for path, size, mtime in read_table(stat_path_for(filename))
+    }
+
+
+def read_dirs(filename) -> dict:
+    if not os.path.exists(dirs_path_for(filename)):
+        return {}
+    return {path: int(mtime) for path, mtime in read_table(dirs_path_for(filename))}
+
+
+def scan_dir(path, exts, with_stat=False):
+    # the directory is stat'ed before it is listed, so entries added while
+    # listing change its mtime again and are picked up by the next update
+    dir_mtime = os.stat(path).st_mtime_ns
+    files, subdirs = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.rpartition(".")[2].lower() in exts and entry.is_file():
+                if with_stat:
+                    st = entry.stat()
+                    files.append((entry.path, st.st_size, st.st_mtime_ns))
+                else:
+                    files.append((entry.path,))
+    files.sort()
+    return path, dir_mtime, files, subdirs
+
+
+def iter_images(image_dir, exts=ext_list, recursive=False, workers=None,
+                with_stat=False, dirs=None):
+    """Yield ``(path,)`` or ``(path, size, mtime_ns)`` for every image under
+    ``image_dir``, scanning directories concurrently as they are found.
+    The mtime of every scanned directory is recorded in ``dirs``."""
+    exts = {e.lower() for e in exts}
+    with ThreadPoolExecutor(workers) as pool:
+        pending = {pool.submit(scan_dir, image_dir, exts, with_stat)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, dir_mtime, files, subdirs = future.result()
+                if dirs is not None:
+                    dirs[path] = dir_mtime
+                if recursive:
+                    pending.update(pool.submit(scan_dir, d, exts, with_stat) for d in subdirs)
+                yield from files
+
+
+def write_image_list(images, filename, chunk_size=10000, with_stat=False) -> int:
+    sep = list_sep(filename)
+    stat_file = (
+        open(stat_path_for(filename), "w", encoding="utf-8", newline="")
+        if with_stat else nullcontext()
+    )
+    n = 0
+    images = iter(images)
+    with open(filename, "w", encoding="utf-8", newline="") as f, stat_file as stat_f:
+        writer = csv.writer(f, delimiter=sep, lineterminator="\n")
+        if with_stat:
+            stat_writer = csv.writer(stat_f, delimiter="\t", lineterminator="\n")
+        while chunk := list(islice(images, chunk_size)):
+            writer.writerows(
+                (image[0], "P", f"example_{i:0>3}")
+                for i, image in enumerate(chunk, start=n)
+            )
+            if with_stat:
+                stat_writer.writerows(chunk)
+            n += len(chunk)
+    return n
+
+
+def _stat_or_missing(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (MISSING, 0)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def update_image_list(image_dir, filename, exts=ext_list, recursive=False,
+                      workers=None, drop_missing=False) -> dict:
+    """Bring an existing list up to date with ``image_dir``.
+
+    Only directories whose mtime changed since the last run are listed
+    again. New images are appended to the list, images that disappeared
+    are marked ``MISSING`` in the .stat sidecar (or dropped from the list
+    with ``drop_missing``), and the rows already in the list - including
+    their tags - are left untouched.
+    """
+    sep = list_sep(filename)
+    rows = read_table(filename, sep)
+    first = next(rows, None)
+    ncols = len(first) if first is not None else 3
+    paths = [] if first is None else [first[0], *(row[0] for row in rows)]
+    known = set(paths)
+    stats = read_stat(filename)
+    dirs = read_dirs(filename)
+    exts = {e.lower() for e in exts}
+
+    known_by_dir = defaultdict(list)
+    for path in paths:
+        known_by_dir[os.path.dirname(path)].append(path)
+
+    with ThreadPoolExecutor(workers) as pool:
+        dir_mtimes = dict(zip(dirs, pool.map(lambda d: _stat_or_missing(d)[1], dirs)))
+        gone_dirs = [d for d, mtime in dir_mtimes.items() if mtime == 0]
+        to_scan = [d for d, mtime in dir_mtimes.items() if mtime not in (0, dirs[d])]
+        if not dirs:
+            to_scan = [image_dir]
+
+        scanned = {}
+        pending = {pool.submit(scan_dir, d, exts, True) for d in to_scan}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, dir_mtime, files, subdirs = future.result()
+                dirs[path] = dir_mtime
+                scanned[path] = files
+                if recursive:
+                    # known sub-directories were already checked above
+                    pending.update(
+                        pool.submit(scan_dir, d, exts, True) for d in subdirs if d not in dirs
+                    )
+        for d in gone_dirs:
+            del dirs[d]
+
+        new_images, vanished, modified = [], [], 0
+        for d, files in scanned.items():
+            seen = set()
+            for path, size, mtime in files:
+                seen.add(path)
+                if path not in known:
+                    new_images.append((path, size, mtime))
+                else:
+                    if path in stats and stats[path] != (size, mtime):
+                        modified += 1
+                    stats[path] = (size, mtime)
+            vanished.extend(p for p in known_by_dir.get(d, ()) if p not in seen)
+        for d in gone_dirs:
+            vanished.extend(known_by_dir.get(d, ()))
+
+        # rows of lists written without --with-stat are stat'ed once
+        handled = set(scanned) | set(gone_dirs)
+        unknown = [p for p in paths if p not in stats and os.path.dirname(p) not in handled]
+        for path, stat in zip(unknown, pool.map(_stat_or_missing, unknown)):
+            stats[path] = stat
+            if stat[0] == MISSING:
+                vanished.append(path)
+
+    newly_missing = [p for p in vanished if stats.get(p, (None,))[0] != MISSING]
+    for path in vanished:
+        stats[path] = (MISSING, 0)
+    new_images.sort()
+
+    n = len(paths)
+    new_rows = [
+        (path, "P", "", f"example_{i:0>3}") if ncols == 4 else (path, "P", f"example_{i:0>3}")
+        for i, (path, _, _) in enumerate(new_images, start=n)
+    ]
+    missing = {p for p, (size, _) in stats.items() if size == MISSING}
+    if drop_missing and missing:
+        kept = [row for row in read_table(filename, sep) if row[0] not in missing]
+        write_table(filename, kept + new_rows, sep)
+        for path in missing:
+            del stats[path]
+    else:
+        write_table(filename, new_rows, sep, mode="a")
+
+    for path, size, mtime in new_images:
+        stats[path] = (size, mtime)
+    write_table(stat_path_for(filename), ((p, *s) for p, s in stats.items()))
+    write_table(dirs_path_for(filename), dirs.items())
+
+    return {
+        "new": len(new_images),
+        "vanished": len(newly_missing),
+        "modified": modified,
+        "scanned_dirs": len(scanned),
+        "dirs": len(dirs),
     }
-)
 
-filename = "image_list.txt"
 
-image_data.to_csv(filename, sep="\t", index=False, header=False)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write an image list for the viewer.")
+    parser.add_argument("image_dir", nargs="?", default="imgs")
+    parser.add_argument("-o", "--output", default="image_list.txt")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="walk sub-directories too")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="directory scanning threads")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="rows written per chunk")
+    parser.add_argument("--with-stat", action="store_true",
+                        help="write size/mtime of every image to <output>.stat")
+    parser.add_argument("-u", "--update", action="store_true",
+                        help="append new images to an existing list, keeping its tags")
+    parser.add_argument("--drop-missing", action="store_true",
+                        help="with --update, remove vanished images from the list")
+    parser.add_argument("--dedup", action="store_true",
+                        help="list only the first image of every group of near-duplicates")
+    parser.add_argument("--dedup-threshold", type=int, default=None,
+                        help="max. differing hash bits of near-duplicates (see dedup.py)")
+    args = parser.parse_args()
+    if args.dedup and args.update:
+        # an update would list the dropped duplicates as new images
+        parser.error("--dedup cannot be combined with --update")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.update and os.path.exists(args.output):
+        summary = update_image_list(
+            args.image_dir, args.output, recursive=args.recursive,
+            workers=args.workers, drop_missing=args.drop_missing,
+        )
+        print(
+            f"Update an image list: {args.output} "
+            f"({summary['new']} new, {summary['vanished']} vanished, "
+            f"{summary['modified']} modified; "
+            f"{summary['scanned_dirs']}/{summary['dirs']} directories scanned)"
+        )
+    else:
+        with_stat = args.with_stat or args.update
+        dirs = {}
+        images = iter_images(
+            args.image_dir, recursive=args.recursive, workers=args.workers,
+            with_stat=with_stat, dirs=dirs,
+        )
+        if args.dedup:
+            import dedup
+
+            images = list(images)
+            groups = dedup.find_duplicates(
+                [image[0] for image in images],
+                threshold=args.dedup_threshold if args.dedup_threshold is not None
+                else dedup.DEFAULT_THRESHOLD,
+                workers=args.workers,
+            )
+            keep = dedup.representatives(groups)
+            print(f"Skip {len(images) - int(keep.sum())} near-duplicates")
+            images = [image for image, k in zip(images, keep) if k]
+        n = write_image_list(images, args.output, args.chunk_size, with_stat)
+        if with_stat:
+            write_table(dirs_path_for(args.output), dirs.items())
 
-print(f"Write an image list to: {filename}")
+        print(f"Write an image list to: {args.output} ({n} images)")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Find near-duplicate images by perceptual hash.
+
+Every image gets a 64-bit DCT hash (computed on a process pool and cached
+per path and mtime); images whose hashes differ in at most ``threshold``
+bits end up in one group. Candidate pairs are images that share one 16-bit
+quarter of their hash, so pairs within 3 bits are always found and pairs
+within 4-7 bits unless their differing bits are spread over every quarter.
+"""
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 4
+DEFAULT_CACHE = os.path.expanduser("~/.cache/img_labeler/phash.sqlite")
+
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+
+# pairs are compared this many rows at a time inside large buckets
+_BLOCK = 1024
+
+
+def phash(filename):
+    """64-bit perceptual hash of ``filename`` (None if it cannot be
+    decoded)."""
+    import cv2
+
+    try:
+        data = np.fromfile(filename, dtype=np.uint8)
+    except OSError:
+        return None
+    array = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if array is None:
+        return None
+    small = cv2.resize(array, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # the DC term only says how bright the image is
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class HashCache:
+    """Hashes in one SQLite file, keyed by image path and mtime."""
+
+    def __init__(self, path=DEFAULT_CACHE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS phashes ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, hash INTEGER)"
+        )
+
+    def lookup(self, paths, mtimes) -> dict:
+        """{index: hash or None} of the paths cached with the given mtime."""
+        conn = self._conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (i INTEGER, path TEXT, mtime_ns INTEGER)")
+        conn.execute("DELETE FROM wanted")
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO wanted VALUES (?, ?, ?)", zip(range(len(paths)), paths, mtimes))
+        conn.execute("COMMIT")
+        rows = conn.execute(
+            "SELECT w.i, p.hash FROM wanted w JOIN phashes p"
+            " ON p.path = w.path AND p.mtime_ns = w.mtime_ns"
+        )
+        return {i: _unsigned(h) for i, h in rows}
+
+    def store(self, entries):
+        """Store ``(path, mtime_ns, hash or None)`` entries."""
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO phashes VALUES (?, ?, ?)",
+            ((path, mtime, _signed(h)) for path, mtime, h in entries),
+        )
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+
+def _signed(h):
+    # SQLite integers are signed 64-bit
+    return None if h is None else h - 2**64 if h >= 2**63 else h
+
+
+def _unsigned(h):
+    return None if h is None else h % 2**64
+
+
+def _mtime_or_missing(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def compute_hashes(paths, cache_path=DEFAULT_CACHE, workers=None, mp_context=None):
+    """Hashes of ``paths`` as a uint64 array, with a mask of the images
+    that could be hashed."""
+    mtimes = [_mtime_or_missing(p) for p in paths]
+    cache = HashCache(cache_path)
+    try:
+        known = cache.lookup(paths, mtimes)
+        todo = [i for i in range(len(paths)) if i not in known and mtimes[i] != -1]
+        if todo:
+            with ProcessPoolExecutor(workers, mp_context=mp_context) as pool:
+                computed = list(pool.map(phash, [paths[i] for i in todo], chunksize=64))
+            cache.store((paths[i], mtimes[i], h) for i, h in zip(todo, computed))
+            known.update(zip(todo, computed))
+    finally:
+        cache.close()
+
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    valid = np.zeros(len(paths), dtype=bool)
+    for i, h in known.items():
+        if h is not None:
+            hashes[i] = h
+            valid[i] = True
+    return hashes, valid
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return np.unpackbits(x.view(np.uint8).reshape(*x.shape, 8), axis=-1).sum(axis=-1)
+
+
+def _close_pairs(rows, hashes, threshold):
+    """Pairs (i < j) among ``rows`` whose hashes are within ``threshold``."""
+    firsts, seconds = [], []
+    for start in range(0, len(rows), _BLOCK):
+        block = rows[start:start + _BLOCK]
+        rest = rows[start:]
+        distances = _popcount(hashes[block][:, None] ^ hashes[rest][None, :])
+        i, j = np.nonzero(distances <= threshold)
+        # upper triangle only: rest[j] comes after block[i]
+        keep = j > i
+        firsts.append(block[i[keep]])
+        seconds.append(rest[j[keep]])
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def find_groups(hashes, valid, threshold=DEFAULT_THRESHOLD) -> np.ndarray:
+    """Group of every image, as the index of its first member; images
+    without near-duplicates (or without a hash) are their own group."""
+    n = len(hashes)
+    valid_rows = np.flatnonzero(valid)
+    # identical hashes (blank or uniform crops are common) are joined to
+    # their first image directly; only distinct hashes are compared, so a
+    # big bucket of them does not turn into all of its pairs
+    _, first, inverse = np.unique(hashes[valid_rows], return_index=True, return_inverse=True)
+    rows = valid_rows[first]
+    firsts, seconds = [rows[inverse]], [valid_rows]
+    for band in range(_BANDS):
+        keys = (hashes[rows] >> np.uint64(band * _BAND_BITS)) & np.uint64(2**_BAND_BITS - 1)
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.diff(keys[order])) + 1
+        for bucket in np.split(rows[order], starts):
+            if len(bucket) > 1:
+                a, b = _close_pairs(np.sort(bucket), hashes, threshold)
+                firsts.append(a)
+                seconds.append(b)
+    a, b = np.concatenate(firsts), np.concatenate(seconds)
+
+    # connected components: propagate the smallest index until stable
+    groups = np.arange(n)
+    while True:
+        previous = groups.copy()
+        low = np.minimum(groups[a], groups[b])
+        np.minimum.at(groups, a, low)
+        np.minimum.at(groups, b, low)
+        groups = groups[groups]
+        if np.array_equal(groups, previous):
+            return groups
+
+
+def find_duplicates(paths, threshold=DEFAULT_THRESHOLD, cache_path=DEFAULT_CACHE, workers=None,
+                    mp_context=None):
+    hashes, valid = compute_hashes(paths, cache_path, workers, mp_context)
+    return find_groups(hashes, valid, threshold)
+
+
+def representatives(groups: np.ndarray) -> np.ndarray:
+    """Mask of the first image of every group."""
+    return groups == np.arange(len(groups))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Group near-duplicate images of a list.")
+    parser.add_argument("list", help="image list (.txt/.tsv/.csv)")
+    parser.add_argument("-t", "--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="max. differing hash bits of near-duplicates")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="hashing processes")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="SQLite file of computed hashes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import csv
+
+    from label_data import list_sep
+
+    args = parse_args()
+    with open(args.list, encoding="utf-8", newline="") as f:
+        paths = [row[0] for row in csv.reader(f, delimiter=list_sep(args.list)) if row]
+    groups = find_duplicates(paths, args.threshold, args.cache, args.workers)
+    order = np.argsort(groups, kind="stable")
+    n_groups = 0
+    for members in np.split(order, np.flatnonzero(np.diff(groups[order])) + 1):
+        if len(members) > 1:
+            n_groups += 1
+            print("\t".join(paths[i] for i in members))
+    print(f"{len(paths)} images, {int(representatives(groups).sum())} after removing "
+          f"near-duplicates ({n_groups} groups)")
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Export a tagged image list as a training dataset.
+
+Rows are picked and classed by ``--by``: ``pred`` keeps the rows tagged 맞
+(prediction confirmed) under their ``pred.``, ``tag`` keeps every tagged
+row under its tag. Tags still in the list's journal are included.
+
+Images go to one directory per class, or with ``--shards`` into
+WebDataset-style tar shards holding ``<key>.<ext>``, ``<key>.cls`` (index
+into ``classes.txt``) and ``<key>.json`` (the row) per sample. Images that
+need no resizing or re-encoding are hard-linked (copied across file
+systems, or with ``--copy``); the others are transcoded with OpenCV on a
+process pool.
+
+Exports can be resumed: files and shards are written under a temporary
+name and renamed once complete, so a rerun into the same directory only
+does what is missing. ``export.json`` records the options and rows of an
+export, and a rerun with other ones is refused. It also lists the samples
+that failed; a rerun retries them (in the shard layout, into extra shards
+after the regular ones).
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from compact_table import text_frame
+from label_data import FILENAME_COL, MAIN_TAG_TRUE, PRED_COL, TAG_COL, read_list
+from tag_journal import TagJournal
+
+BY_PRED = "pred"
+BY_TAG = "tag"
+FORMATS = ["jpg", "png", "webp"]
+DEFAULT_QUALITY = 95
+DEFAULT_SHARD_SIZE = 1000
+
+MANIFEST = "export.json"
+CLASSES = "classes.txt"
+
+# rows handed to the pool at a time in the directory layout
+BATCH = 1024
+
+
+def select_rows(metadata, by=BY_PRED):
+    """(positions, class names) of the rows to export."""
+    tags = metadata[TAG_COL].astype(object)
+    tagged = tags.notna() & (tags != "")
+    if by == BY_PRED:
+        keep = tagged & tags.astype(str).str.startswith(MAIN_TAG_TRUE) & metadata[PRED_COL].notna()
+        classes = metadata[PRED_COL]
+    else:
+        keep = tagged
+        classes = tags
+    positions = np.flatnonzero(keep.to_numpy(dtype=bool))
+    return positions, [str(c) for c in classes.iloc[positions].tolist()]
+
+
+def sample_key(path: str) -> str:
+    """Output name of ``path``: its stem plus a hash of the whole path, so
+    equal basenames from different directories do not collide. Dots are
+    replaced since WebDataset splits keys at the first one."""
+    stem = os.path.splitext(os.path.basename(path))[0].replace(".", "_")
+    return f"{stem}-{zlib.crc32(path.encode('utf-8')):08x}"
+
+
+def class_dir(name: str) -> str:
+    name = name.replace("/", "_").replace("\\", "_")
+    return "_" if name in ("", ".", "..") else name
+
+
+def _ext(path: str) -> str:
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+
+def _same_format(ext: str, fmt: str) -> bool:
+    return fmt is None or ext == fmt or {ext, fmt} == {"jpg", "jpeg"}
+
+
+def transcode(source: str, size=None, fmt=None, quality=DEFAULT_QUALITY):
+    """``source`` scaled to fit ``size`` x ``size`` and/or encoded as
+    ``fmt``, as bytes; None if the file can be used as it is."""
+    import cv2
+
+    array = cv2.imdecode(np.fromfile(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if array is None:
+        raise ValueError("cannot decode")
+    h, w = array.shape[:2]
+    scale = min(1.0, size / max(w, h)) if size else 1.0
+    same_format = _same_format(_ext(source), fmt)
+    if scale == 1.0 and same_format:
+        return None
+    if scale < 1.0:
+        array = cv2.resize(array, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+    fmt = fmt or _ext(source)
+    params = {
+        "jpg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+        "jpeg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+        "webp": [cv2.IMWRITE_WEBP_QUALITY, quality],
+    }.get(fmt, [])
+    ok, encoded = cv2.imencode(f".{fmt}", array, params)
+    if not ok:
+        raise ValueError(f"cannot encode as {fmt}")
+    return encoded.tobytes()
+
+
+def _write_atomic(target: str, data: bytes):
+    tmp = f"{target}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+def _link(source: str, target: str, copy=False):
+    tmp = f"{target}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    if copy:
+        shutil.copyfile(source, tmp)
+    else:
+        try:
+            os.link(source, tmp)
+        except OSError:
+            # other file system, or links not supported
+            shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+def _export_file(task):
+    """Write one image of the directory layout; returns (transcoded,
+    error)."""
+    source, target, size, fmt, quality, copy = task
+    try:
+        data = transcode(source, size, fmt, quality) if size or fmt else None
+        if data is None:
+            _link(source, target, copy)
+        else:
+            _write_atomic(target, data)
+        return data is not None, None
+    except (OSError, ValueError) as e:
+        return False, f"{source}: {e}"
+
+
+def _sample_bytes(task):
+    """(bytes, transcoded, error) of one image of a shard."""
+    source, size, fmt, quality = task
+    try:
+        data = transcode(source, size, fmt, quality) if size or fmt else None
+        if data is not None:
+            return data, True, None
+        with open(source, "rb") as f:
+            return f.read(), False, None
+    except (OSError, ValueError) as e:
+        return None, False, f"{source}: {e}"
+
+
+class Export:
+    """One dataset export of ``metadata`` into ``output``."""
+
+    def __init__(self, metadata, output, by=BY_PRED, shards=False, shard_size=DEFAULT_SHARD_SIZE,
+                 size=None, fmt=None, quality=DEFAULT_QUALITY, copy=False, workers=None):
+        self.output = output
+        self.shards = shards
+        self.shard_size = shard_size
+        self.size = size
+        self.fmt = fmt
+        self.quality = quality
+        self.copy = copy
+        self.workers = workers
+
+        positions, self.classes = select_rows(metadata, by)
+        self.class_names = sorted(set(self.classes))
+        self.sources = metadata[FILENAME_COL].iloc[positions].tolist()
+        self.keys = [sample_key(s) for s in self.sources]
+        # float32 scores as they were read (see compact_table)
+        self.rows = text_frame(metadata.iloc[positions])
+        self.options = {
+            "by": by,
+            "layout": "shards" if shards else "dirs",
+            "shard_size": shard_size if shards else None,
+            "size": size,
+            "format": fmt,
+            "quality": quality if size or fmt else None,
+            "samples": len(self.keys),
+            "digest": hashlib.sha1(
+                "\n".join(f"{k}\t{c}" for k, c in zip(self.keys, self.classes)).encode("utf-8")
+            ).hexdigest(),
+        }
+        self.counts = {"unchanged": 0, "transcoded": 0, "skipped": 0, "failed": 0}
+        self.errors = []
+        # key -> source of the samples that are not in the output
+        self.failed = {}
+
+    def prepare(self):
+        """Create ``output``, or check that it holds this same export."""
+        os.makedirs(self.output, exist_ok=True)
+        path = os.path.join(self.output, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                previous = json.load(f)
+            self.failed = previous.pop("failed", {})
+            if previous != self.options:
+                raise ValueError(
+                    f"{self.output} holds an export with other options or rows; "
+                    "use another output directory"
+                )
+            return
+        with open(os.path.join(self.output, CLASSES), "w", encoding="utf-8") as f:
+            f.writelines(f"{name}\n" for name in self.class_names)
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = dict(self.options, failed=self.failed)
+        _write_atomic(os.path.join(self.output, MANIFEST),
+                      json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+
+    def _count(self, i, transcoded, error):
+        if error is not None:
+            self.counts["failed"] += 1
+            self.errors.append(error)
+            self.failed[self.keys[i]] = self.sources[i]
+        else:
+            self.counts["transcoded" if transcoded else "unchanged"] += 1
+            self.failed.pop(self.keys[i], None)
+
+    def run(self, progress=None):
+        self.prepare()
+        transcoding = self.size is not None or self.fmt is not None
+        with ProcessPoolExecutor(self.workers) if transcoding else _Serial() as pool:
+            if self.shards:
+                self._run_shards(pool, progress)
+            else:
+                self._run_dirs(pool, progress)
+        return self.counts
+
+    def _target(self, i):
+        ext = self.fmt or _ext(self.sources[i])
+        return os.path.join(self.output, class_dir(self.classes[i]), f"{self.keys[i]}.{ext}")
+
+    def _run_dirs(self, pool, progress):
+        for name in self.class_names:
+            os.makedirs(os.path.join(self.output, class_dir(name)), exist_ok=True)
+        for start in range(0, len(self.keys), BATCH):
+            todo, tasks = [], []
+            failed = dict(self.failed)
+            for i in range(start, min(start + BATCH, len(self.keys))):
+                target = self._target(i)
+                if os.path.exists(target):
+                    self.counts["skipped"] += 1
+                    self.failed.pop(self.keys[i], None)
+                else:
+                    todo.append(i)
+                    tasks.append((self.sources[i], target, self.size, self.fmt, self.quality,
+                                  self.copy))
+            for i, (transcoded, error) in zip(todo, pool.map(_export_file, tasks, chunksize=16)):
+                self._count(i, transcoded, error)
+            if self.failed != failed:
+                self._write_manifest()
+            if progress is not None:
+                progress(min(start + BATCH, len(self.keys)), len(self.keys))
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.output, f"shard-{shard:06d}.tar")
+
+    def _run_shards(self, pool, progress):
+        retry = []
+        for shard, start in enumerate(range(0, len(self.keys), self.shard_size)):
+            stop = min(start + self.shard_size, len(self.keys))
+            if os.path.exists(self.shard_path(shard)):
+                # done, except for the samples that failed in it
+                failed = [i for i in range(start, stop) if self.keys[i] in self.failed]
+                retry.extend(failed)
+                self.counts["skipped"] += stop - start - len(failed)
+            else:
+                self._write_shard(pool, shard, range(start, stop))
+            if progress is not None:
+                progress(stop, len(self.keys))
+
+        # retried samples go to extra shards numbered after the regular ones
+        shard = -(-len(self.keys) // self.shard_size)
+        for start in range(0, len(retry), self.shard_size):
+            while os.path.exists(self.shard_path(shard)):
+                shard += 1
+            self._write_shard(pool, shard, retry[start:start + self.shard_size])
+
+    def _write_shard(self, pool, shard: int, indices):
+        index = {name: i for i, name in enumerate(self.class_names)}
+        tasks = [(self.sources[i], self.size, self.fmt, self.quality) for i in indices]
+        path = self.shard_path(shard)
+        tmp = f"{path}.tmp"
+        written = 0
+        with tarfile.open(tmp, "w") as tar:
+            results = pool.map(_sample_bytes, tasks, chunksize=16)
+            for i, (data, transcoded, error) in zip(indices, results):
+                self._count(i, transcoded, error)
+                if error is not None:
+                    continue
+                written += 1
+                key = self.keys[i]
+                ext = self.fmt or _ext(self.sources[i])
+                row = {col: _plain(self.rows[col].iloc[i]) for col in self.rows.columns}
+                row["class"] = self.classes[i]
+                _add(tar, f"{key}.{ext}", data)
+                _add(tar, f"{key}.cls", str(index[self.classes[i]]).encode("ascii"))
+                _add(tar, f"{key}.json", json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        # the failed samples are listed before the shard counts as done, so
+        # that a rerun retries them
+        self._write_manifest()
+        if written:
+            os.replace(tmp, path)
+        else:
+            # nothing to keep; a rerun retries the whole shard
+            os.remove(tmp)
+
+
+class _Serial:
+    """Stands in for the pool when nothing is transcoded: linking and
+    reading files is I/O the main process can do as fast."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @staticmethod
+    def map(fn, tasks, chunksize=1):
+        return map(fn, tasks)
+
+
+def _plain(value):
+    """JSON-able ``value``: numpy scalars as Python ones, missing as None."""
+    if value is None or value != value:
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _add(tar, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def read_tagged_list(filename):
+    """The list with the tags of its journal that were not exported yet."""
+    metadata = read_list(filename)
+    TagJournal.replay(metadata, filename, FILENAME_COL, TAG_COL)
+    return metadata
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export a tagged image list as a dataset.")
+    parser.add_argument("list", help="tagged image list (.txt/.tsv/.csv)")
+    parser.add_argument("output", help="dataset directory (rerun to resume)")
+    parser.add_argument("--by", choices=[BY_PRED, BY_TAG], default=BY_PRED,
+                        help=f"'{BY_PRED}': rows tagged {MAIN_TAG_TRUE} by their pred. (default); "
+                             f"'{BY_TAG}': every tagged row by its tag")
+    parser.add_argument("--shards", action="store_true",
+                        help="write WebDataset-style tar shards instead of class directories")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="samples per shard")
+    parser.add_argument("--size", type=int, default=None,
+                        help="scale images down to fit SIZE x SIZE")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="re-encode images (default: keep their format)")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY,
+                        help="JPEG/WebP quality of re-encoded images")
+    parser.add_argument("--copy", action="store_true",
+                        help="copy images that are not transcoded instead of hard-linking them")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="transcoding processes")
+    args = parser.parse_args()
+    if args.shard_size < 1:
+        parser.error("--shard-size must be positive")
+    if args.size is not None and args.size < 1:
+        parser.error("--size must be positive")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    export = Export(
+        read_tagged_list(args.list), args.output, by=args.by, shards=args.shards,
+        shard_size=args.shard_size, size=args.size, fmt=args.format, quality=args.quality,
+        copy=args.copy, workers=args.workers,
+    )
+    print(f"{len(export.keys)} images in {len(export.class_names)} classes -> {args.output}")
+    try:
+        counts = export.run(
+            progress=lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr)
+        )
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    print(file=sys.stderr)
+    for error in export.errors:
+        print(error, file=sys.stderr)
+    print(", ".join(f"{n} {what}" for what, n in counts.items()))
+    if counts["failed"]:
+        sys.exit(1)
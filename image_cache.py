@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtGui import QImage
+
+
+class ImageCache:
+    """LRU cache of decoded images bounded by their size in bytes.
+
+    Entries are keyed by ``(path, mtime, target size)`` so an image that is
+    rewritten on disk is decoded again. Shared between the GUI thread and
+    the decode workers, hence the lock.
+    """
+
+    def __init__(self, budget_bytes: int = 512 * 2**20):
+        self.budget_bytes = budget_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(filename: str, target_size=None):
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            mtime = None
+        return (filename, mtime, target_size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, count=True):
+        """The cached image or None. Only lookups with ``count`` (the
+        images the user asked for, not prefetches) go into the hit rate."""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return image
+
+    def put(self, key, image: QImage):
+        nbytes = image.sizeInBytes()
+        if nbytes > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old.sizeInBytes()
+            self._entries[key] = image
+            self.size_bytes += nbytes
+            while self.size_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= evicted.sizeInBytes()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def summary(self) -> str:
+        return (
+            f"cache {self.hits} hits / {self.misses} misses, "
+            f"{len(self)} images, "
+            f"{self.size_bytes / 2**20:.0f}/{self.budget_bytes / 2**20:.0f} MB"
+        )
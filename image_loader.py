@@ -0,0 +1,197 @@
+import time
+
+import numpy as np
+
+from PyQt5.QtCore import Qt, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
+
+from image_cache import ImageCache
+
+NATIVE_SIZE_KEY = "native-size"
+
+# JPEG can be decoded straight at 1/2, 1/4 or 1/8 of its resolution
+_REDUCED_FLAGS = {
+    8: "IMREAD_REDUCED_COLOR_8",
+    4: "IMREAD_REDUCED_COLOR_4",
+    2: "IMREAD_REDUCED_COLOR_2",
+}
+
+
+def native_size(image: QImage) -> QSize:
+    w, h = image.text(NATIVE_SIZE_KEY).split("x")
+    return QSize(int(w), int(h))
+
+
+def _decode_scaled(filename: str, size: QSize, scale: float) -> QImage:
+    # imported on first use (in a worker), it costs ~0.1s of start-up
+    import cv2
+
+    w = max(1, round(size.width() * scale))
+    h = max(1, round(size.height() * scale))
+    flags = cv2.IMREAD_COLOR
+    for reduction, reduced_flags in _REDUCED_FLAGS.items():
+        if scale * reduction <= 1.0:
+            flags = getattr(cv2, reduced_flags)
+            break
+    # QImage ignores EXIF orientation, so every level of the pyramid must too
+    array = cv2.imdecode(
+        np.fromfile(filename, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if array is None:
+        # formats OpenCV cannot read (e.g. gif) are scaled by Qt
+        return QImage(filename).scaled(w, h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    if array.shape[:2] != (h, w):
+        array = cv2.resize(array, (w, h), interpolation=cv2.INTER_AREA)
+    return QImage(array.data, w, h, array.strides[0], QImage.Format_BGR888).copy()
+
+
+def decode_image(filename: str, target_size=None) -> QImage:
+    """Decode ``filename`` to fit in ``target_size`` (w, h), or at full
+    resolution if it is None. Images are never upscaled; the full size is
+    stored in the image's ``NATIVE_SIZE_KEY`` text."""
+    size = QImageReader(filename).size()
+    if target_size is None or not size.isValid():
+        image = QImage(filename)
+        size = image.size()
+    else:
+        scale = min(1.0, target_size[0] / size.width(), target_size[1] / size.height())
+        if scale < 1.0:
+            image = _decode_scaled(filename, size, scale)
+        else:
+            image = QImage(filename)
+    if not image.isNull():
+        image.setText(NATIVE_SIZE_KEY, f"{size.width()}x{size.height()}")
+    return image
+
+
+class _DecodeJob(QRunnable):
+    def __init__(self, loader, filename: str, target_size):
+        super().__init__()
+        self.loader = loader
+        self.filename = filename
+        self.target_size = target_size
+        self.started = False
+
+    def run(self):
+        self.started = True
+        cache = self.loader.cache
+        source = self.loader.source
+        metrics = self.loader.metrics
+        try:
+            if source is None:
+                local_path = self.filename
+            else:
+                t0 = time.perf_counter()
+                local_path = source.fetch(self.filename)
+                if metrics is not None:
+                    metrics.record("fetch", time.perf_counter() - t0, self.filename)
+        except Exception:
+            # unreachable remote file; reported like an unreadable one
+            self.loader._decoded.emit(self.filename, self.target_size, QImage())
+            return
+        key = cache.key(local_path, self.target_size)
+        # counted by request already
+        image = cache.get(key, count=False)
+        if image is None:
+            t0 = time.perf_counter()
+            image = decode_image(local_path, self.target_size)
+            if metrics is not None:
+                metrics.record("decode", time.perf_counter() - t0, self.filename)
+            if not image.isNull():
+                cache.put(key, image)
+        self.loader._decoded.emit(self.filename, self.target_size, image)
+
+
+class ImageLoader(QObject):
+    """Decodes images on a worker pool and hands them back to the GUI thread.
+
+    ``request`` asks for the image the user is looking at and the rows
+    around it. Moving the window drops queued jobs that fell out of it;
+    ``imageReady`` fires for every image that is still wanted when its
+    decode finishes. Decoded images are kept in ``cache``. With a
+    ``source`` (see remote_source.RemoteImageSource) filenames are remote
+    paths that the workers download before decoding. Fetch and decode
+    times go to ``metrics`` (see metrics.SessionMetrics) if given.
+    """
+
+    imageReady = pyqtSignal(str, object, QImage)
+    _decoded = pyqtSignal(str, object, QImage)
+
+    def __init__(self, cache: ImageCache, source=None, max_workers: int = 0, parent=None,
+                 metrics=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.source = source
+        self.metrics = metrics
+        self.pool = QThreadPool(self)
+        if max_workers > 0:
+            self.pool.setMaxThreadCount(max_workers)
+
+        self._jobs = {}
+        self._wanted = set()
+        self._decoded.connect(self._onDecoded)
+
+    def localPath(self, filename: str):
+        if self.source is None:
+            return filename
+        return self.source.local_path(filename)
+
+    def isPending(self, filename: str, target_size=None) -> bool:
+        return (filename, target_size) in self._jobs
+
+    def cached(self, filename: str, target_size=None, count=True):
+        local_path = self.localPath(filename)
+        # a remote file that was never fetched is a miss too
+        key = self.cache.key(local_path, target_size) if local_path is not None else None
+        return self.cache.get(key, count)
+
+    def request(self, filename: str, target_size=None, window=(), window_target_size=None,
+                companions=()):
+        """Make ``filename`` at ``target_size`` the current image and
+        prefetch ``window`` (ordered nearest first) at
+        ``window_target_size``. Returns the current image right away if it
+        is cached, otherwise ``imageReady`` delivers it later.
+
+        ``companions`` are shown next to the current image (see
+        compare_view) at the same size; they are decoded right after it
+        and always delivered by ``imageReady``, cached or not."""
+        image = self.cached(filename, target_size)
+        # neighbours that are cached already need no job
+        wanted = [(f, window_target_size) for f in window
+                  if self.cached(f, window_target_size, count=False) is None]
+        ready = []
+        for companion in reversed(companions):
+            cached = self.cached(companion, target_size)
+            if cached is None:
+                wanted.insert(0, (companion, target_size))
+            else:
+                ready.append((companion, cached))
+        if image is None:
+            wanted.insert(0, (filename, target_size))
+        self._wanted = set(wanted)
+
+        # queued jobs for rows the user jumped away from are cancelled;
+        # running ones finish and are dropped in _onDecoded
+        self.pool.clear()
+        self._jobs = {key: job for key, job in self._jobs.items() if job.started}
+
+        for priority, key in enumerate(reversed(wanted)):
+            if key in self._jobs:
+                continue
+            job = _DecodeJob(self, *key)
+            self._jobs[key] = job
+            self.pool.start(job, priority)
+        for companion, cached in ready:
+            self.imageReady.emit(companion, target_size, cached)
+        return image
+
+    def _onDecoded(self, filename: str, target_size, image: QImage):
+        key = (filename, target_size)
+        self._jobs.pop(key, None)
+        if key not in self._wanted:
+            return
+        self.imageReady.emit(filename, target_size, image)
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
@@ -0,0 +1,204 @@
+# shared by the viewer and the command line tools: nothing here may import
+# Qt, OpenCV or paramiko, and pandas is only imported once a list is read
+import threading
+
+import numpy as np
+
+from list_sidecar import load_sidecar, write_sidecar, source_stat
+from tag_journal import TagJournal, atomic_write_table
+
+FILENAME_COL = "filename"
+PRED_COL = "pred."
+TAG_COL = "tag"
+SCORE_COL = "conf. score"
+ORIGIN_COLS = [FILENAME_COL, PRED_COL, SCORE_COL]
+TAGGED_COLS = [FILENAME_COL, PRED_COL, TAG_COL, SCORE_COL]
+# up to 3 more paths after the tagged columns, shown next to the row's
+# image by the viewer's compare view (e.g. the reference image, or the
+# crop of a previous model)
+COMPARE_COLS = ["compare 1", "compare 2", "compare 3"]
+
+# lists are parsed this many rows at a time, each chunk compacted before
+# the next one is read (see compact_table)
+READ_CHUNK_ROWS = 2**20
+
+MAIN_TAG_TRUE = "맞"
+MAIN_TAG_FALSE = "틀"
+
+
+def list_sep(filename) -> str:
+    return "," if filename.endswith("csv") else "\t"
+
+
+def compact_list(metadata):
+    """``metadata`` with categorical pred./tag, float scores as float32 (where
+    lossless) and filenames as a ``PathArray``. Lists read from text only
+    get their ``PathArray`` columns in the sidecar (see
+    ``LabelList.write_sidecar``)."""
+    from compact_table import compact
+
+    return compact(metadata, categorical=[PRED_COL, TAG_COL], numeric=[SCORE_COL])
+
+
+def read_list(filename, sep=None):
+    """Read a 3-column (untagged) or 4-column (tagged) list as the 4 tagged
+    columns, plus the compare columns of a 5- to 7-column list, compacted
+    (see ``compact_list``) except for the paths, which stay plain strings
+    so that opening a text list does not build their tables."""
+    import pandas as pd
+    from compact_table import compact, compact_scores, concat
+
+    chunks = []
+    reader = pd.read_csv(
+        filename, sep=sep or list_sep(filename), header=None, chunksize=READ_CHUNK_ROWS,
+        dtype={0: object, 1: "category"},
+    )
+    for metadata in reader:
+        if metadata.shape[1] == 3:
+            metadata.columns = ORIGIN_COLS
+            metadata[TAG_COL] = None
+            metadata = metadata.loc[:, TAGGED_COLS]
+        elif 4 <= metadata.shape[1] <= len(TAGGED_COLS) + len(COMPARE_COLS):
+            metadata.columns = TAGGED_COLS + COMPARE_COLS[:metadata.shape[1] - 4]
+        else:
+            raise ValueError("Data File Column shoud be one of {3, 4, 5, 6, 7}")
+        # scores stay float64 until all chunks are in
+        chunks.append(compact(metadata, categorical=[PRED_COL, TAG_COL], paths=False))
+    if not chunks:
+        raise ValueError("Data File Column shoud be one of {3, 4, 5, 6, 7}")
+    metadata = concat(chunks) if len(chunks) > 1 else chunks[0]
+    if pd.api.types.is_numeric_dtype(metadata[SCORE_COL]):
+        metadata[SCORE_COL] = compact_scores(metadata[SCORE_COL])
+    return metadata
+
+
+def make_tag(main_tag: str, sub_tag: str = "") -> str:
+    return f"{main_tag.title()}{sub_tag}"
+
+
+class LabelList:
+    """An image list opened for tagging.
+
+    Tags go to the frame and to the list's ``TagJournal``; the text list is
+    only rewritten by ``export`` (and ``close``). A columnar sidecar for
+    fast reopening is refreshed in the background every ``sidecar_every``
+    tags. A ``read_only`` list (pending journal tags included) cannot be
+    tagged and leaves every file as it is.
+    """
+
+    def __init__(self, filename, sidecar_every=1000, read_only=False):
+        self.filename = filename
+        self.sep = list_sep(filename)
+        self.stat = source_stat(filename)
+        self.sidecar_every = sidecar_every
+        self.sidecar_records = 0
+        self._sidecar_thread = None
+        # PathArray columns built for the sidecar, reused by later ones
+        self._paths = {}
+        self.journal = None
+        self.read_only = read_only
+
+        self.metadata = load_sidecar(filename)
+        if self.metadata is None:
+            self.metadata = read_list(filename, self.sep)
+            if not read_only:
+                self.write_sidecar(background=True)
+        else:
+            # no-op unless the sidecar holds columns it could not compact
+            self.metadata = compact_list(self.metadata)
+
+        # replay tags that were not exported to the list yet
+        self.replayed = TagJournal.replay(self.metadata, filename, FILENAME_COL, TAG_COL)
+        if not read_only:
+            self.journal = TagJournal(filename)
+        self.compare_cols = [c for c in COMPARE_COLS if c in self.metadata.columns]
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def row(self, position: int) -> dict:
+        """Values of one row, None where missing."""
+        return {col: self.value(position, col) for col in TAGGED_COLS}
+
+    def value(self, position: int, col: str):
+        value = self.metadata[col].array[position]
+        return None if value is None or value != value else value
+
+    def tag_rows(self, positions, tag: str, journal=True) -> np.ndarray:
+        """Tag the rows at ``positions``; tags that are persisted elsewhere
+        (e.g. in a work queue) can skip the journal."""
+        from compact_table import assign
+
+        if self.read_only:
+            raise ValueError(f"{self.filename} was opened read-only")
+        positions = np.asarray(positions, dtype=np.int64)
+        assign(self.metadata, TAG_COL, positions, tag)
+        if not journal:
+            return positions
+        # only the tagged rows: converting a whole string column costs
+        # ~50 ms at 1M rows
+        self.journal.extend(
+            positions, self.metadata[FILENAME_COL].iloc[positions].to_numpy(), tag
+        )
+        if (self.journal.records - self.sidecar_records >= self.sidecar_every
+                and (self._sidecar_thread is None or not self._sidecar_thread.is_alive())):
+            self.write_sidecar(background=True)
+        return positions
+
+    def sync(self):
+        self.journal.sync()
+
+    def wait_sidecar(self):
+        if self._sidecar_thread is not None:
+            self._sidecar_thread.join()
+
+    def write_sidecar(self, background=False):
+        # the journal is kept: if the text list changes behind our back the
+        # sidecar is discarded and the tags are replayed onto the text list
+        self.wait_sidecar()
+        snapshot = self.metadata.copy()
+        self.sidecar_records = self.journal.records if self.journal is not None else 0
+        self._sidecar_thread = threading.Thread(
+            target=self._write_sidecar, args=(snapshot, self.stat),
+            name="list-sidecar", daemon=True,
+        )
+        self._sidecar_thread.start()
+        if not background:
+            self.wait_sidecar()
+
+    def _write_sidecar(self, snapshot, stat):
+        # the path tables of a list read from text are built here, off the
+        # thread that opened it, and only once per list
+        from compact_table import PathDtype
+
+        if self._paths:
+            snapshot = snapshot.assign(**self._paths)
+        snapshot = compact_list(snapshot)
+        self._paths = {
+            col: snapshot[col] for col in snapshot.columns
+            if isinstance(snapshot[col].dtype, PathDtype)
+        }
+        write_sidecar(snapshot, self.filename, stat)
+
+    def export(self):
+        self.wait_sidecar()
+        snapshot = self.metadata.copy()
+        exported = False
+
+        def export():
+            nonlocal exported
+            atomic_write_table(snapshot, self.filename, self.sep)
+            self.stat = source_stat(self.filename)
+            exported = True
+
+        self.journal.compact(export)
+        self.sidecar_records = self.journal.records
+        if exported:
+            self.write_sidecar(background=True)
+
+    def close(self):
+        if self.read_only:
+            return
+        self.export()
+        self.journal.close()
+        self.wait_sidecar()
@@ -0,0 +1,277 @@
+"""Row access to image lists too large to be read into memory.
+
+``LineIndex`` memory-maps a list once and records where every ``STRIDE``-th
+line starts, so any row is found by parsing at most ``STRIDE`` lines.
+``StreamingList`` serves rows from it and keeps tags in a sparse overlay
+that only lives in the list's ``TagJournal`` until ``export``.
+"""
+import csv
+import io
+import mmap
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from label_data import (
+    COMPARE_COLS, FILENAME_COL, PRED_COL, SCORE_COL, TAG_COL, TAGGED_COLS, list_sep,
+)
+from list_sidecar import source_stat
+from tag_journal import TagJournal
+
+INDEX_VERSION = 2
+
+# a line start is kept for every STRIDE-th line: 10M rows take ~1.2 MB
+STRIDE = 64
+# the file is scanned for newlines this many bytes at a time
+SCAN_BYTES = 64 * 2**20
+# parsed blocks of STRIDE rows kept for the visible window and navigation
+BLOCK_CACHE = 256
+
+
+def index_path_for(filename) -> str:
+    return f"{filename}.lines.npz"
+
+
+def _scan(mm, size: int, stride: int):
+    """(starts of every ``stride``-th line, number of lines) of ``mm``.
+    Blank lines are skipped, as ``read_list`` skips them, so that row
+    numbers (and journal records) agree between both ways of opening."""
+    data = np.frombuffer(mm, dtype=np.uint8, count=size)
+    starts = [np.zeros(1 if size and data[0] != 10 else 0, dtype=np.int64)]
+    lines = len(starts[0])
+    for offset in range(0, size, SCAN_BYTES):
+        # the byte after a newline starts a line, unless it is another
+        # newline (a blank line) or the end of the file
+        begins = np.flatnonzero(data[offset:offset + SCAN_BYTES] == 10).astype(np.int64)
+        begins += offset + 1
+        begins = begins[begins < size]
+        begins = begins[data[begins] != 10]
+        starts.append(begins[(-lines) % stride::stride])
+        lines += len(begins)
+    del data
+    return np.concatenate(starts), lines
+
+
+class LineIndex:
+    """Line starts of a text file, cached in a ``.lines.npz`` next to it
+    (discarded once the file changes)."""
+
+    def __init__(self, filename, stride=STRIDE):
+        self.filename = filename
+        self.stride = stride
+        self._fp = open(filename, "rb")
+        self.size = os.fstat(self._fp.fileno()).st_size
+        # an empty file cannot be mapped
+        self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        loaded = self._load()
+        if loaded is None:
+            self.starts, self.lines = _scan(self._mm, self.size, stride)
+            self._save()
+        else:
+            self.starts, self.lines = loaded
+
+    def _load(self):
+        path = index_path_for(self.filename)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as arrays:
+                version, size, mtime_ns, stride, lines = arrays["meta"].tolist()
+                if (version != INDEX_VERSION or stride != self.stride
+                        or (size, mtime_ns) != source_stat(self.filename)):
+                    return None
+                return arrays["starts"], lines
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self):
+        size, mtime_ns = source_stat(self.filename)
+        meta = np.array([INDEX_VERSION, size, mtime_ns, self.stride, self.lines], dtype=np.int64)
+        path = index_path_for(self.filename)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, starts=self.starts, meta=meta)
+            os.replace(tmp_path, path)
+        except OSError:
+            # read-only directory: the index is rebuilt on every open
+            pass
+
+    def __len__(self):
+        return self.lines
+
+    @property
+    def blocks(self) -> int:
+        return len(self.starts)
+
+    def block_bytes(self, block: int) -> bytes:
+        """Text of lines ``block * stride`` up to the next block."""
+        start = int(self.starts[block])
+        stop = int(self.starts[block + 1]) if block + 1 < len(self.starts) else self.size
+        return self._mm[start:stop]
+
+    def close(self):
+        if self.size:
+            self._mm.close()
+        self._fp.close()
+
+
+def _score(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return value or None
+
+
+def parse_row(fields) -> dict:
+    """The 4 tagged columns of a 3- or 4-field line, plus the compare
+    columns of a longer one."""
+    if len(fields) == 3:
+        filename, pred, score = fields
+        tag = ""
+        compare = []
+    elif 4 <= len(fields) <= len(TAGGED_COLS) + len(COMPARE_COLS):
+        filename, pred, tag, score, *compare = fields
+    else:
+        raise ValueError("Data File Column shoud be one of {3, 4, 5, 6, 7}")
+    row = {
+        FILENAME_COL: filename,
+        PRED_COL: pred or None,
+        TAG_COL: tag or None,
+        SCORE_COL: _score(score),
+    }
+    for col, value in zip(COMPARE_COLS, compare):
+        row[col] = value or None
+    return row
+
+
+class StreamingList:
+    """An image list opened for tagging without reading it into memory.
+
+    Same interface as ``label_data.LabelList`` minus the frame: rows are
+    parsed from the memory-mapped file on demand, and tags are kept in a
+    sparse overlay (row -> (filename, tag)) backed by the list's
+    ``TagJournal``. Unlike ``LabelList``, ``close`` does not rewrite the
+    list; the journal is replayed into the overlay on the next open, and
+    ``export`` merges the overlay into the file in one sequential pass.
+    """
+
+    metadata = None
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sep = list_sep(filename)
+        self.index = LineIndex(filename)
+        self._blocks = OrderedDict()
+        self.columns = len(self._read_block(0)[0]) if len(self.index) else 4
+        self.compare_cols = COMPARE_COLS[:max(0, self.columns - len(TAGGED_COLS))]
+
+        # an overlay record whose row now holds another file is stale (the
+        # list was edited) and is ignored when rows are read
+        self.overlay = {}
+        for record in TagJournal.read_records(filename):
+            self.overlay[record["row"]] = (record["filename"], record["tag"])
+        self.replayed = len(self.overlay)
+        self.journal = TagJournal(filename)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _read_block(self, block: int):
+        text = self.index.block_bytes(block).decode("utf-8")
+        # blank lines within the block are not rows
+        return [fields for fields in csv.reader(io.StringIO(text, newline=""), delimiter=self.sep)
+                if fields]
+
+    def _block(self, block: int):
+        rows = self._blocks.get(block)
+        if rows is None:
+            rows = [parse_row(fields) for fields in self._read_block(block)]
+            self._blocks[block] = rows
+            if len(self._blocks) > BLOCK_CACHE:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block)
+        return rows
+
+    def _file_row(self, position: int) -> dict:
+        if not 0 <= position < len(self.index):
+            raise IndexError(position)
+        block, offset = divmod(position, self.index.stride)
+        return self._block(block)[offset]
+
+    def row(self, position: int) -> dict:
+        """Values of one row, None where missing."""
+        row = self._file_row(position)
+        tagged = self.overlay.get(position)
+        if tagged is not None and tagged[0] == row[FILENAME_COL]:
+            row = dict(row)
+            row[TAG_COL] = tagged[1]
+        return row
+
+    def value(self, position: int, col: str):
+        if col == TAG_COL:
+            return self.row(position)[col]
+        return self._file_row(position)[col]
+
+    def tag_rows(self, positions, tag: str, journal=True) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        filenames = [self._file_row(int(p))[FILENAME_COL] for p in positions]
+        for position, filename in zip(positions.tolist(), filenames):
+            self.overlay[position] = (filename, tag)
+        if journal:
+            self.journal.extend(positions, filenames, tag)
+        return positions
+
+    def sync(self):
+        self.journal.sync()
+
+    def _write(self, f):
+        tagged = np.array(sorted(self.overlay), dtype=np.int64)
+        writer = csv.writer(f, delimiter=self.sep, lineterminator="\n")
+        stride = self.index.stride
+        for block in range(self.index.blocks):
+            first = block * stride
+            lo, hi = np.searchsorted(tagged, [first, first + stride])
+            text = self.index.block_bytes(block).decode("utf-8")
+            if lo == hi and '"' not in text:
+                # nothing to merge or unquote: lines are copied as they are,
+                # with an empty tag before the score if they have none
+                lines = [line for line in text.split("\n") if line]
+                if self.columns == 3:
+                    lines = [head + sep + sep + score
+                             for head, sep, score in (line.rpartition(self.sep) for line in lines)]
+                f.write("\n".join(lines) + "\n")
+                continue
+            for offset, fields in enumerate(
+                    fields for fields in csv.reader(io.StringIO(text, newline=""),
+                                                    delimiter=self.sep)
+                    if fields):
+                if len(fields) == 3:
+                    fields.insert(2, "")
+                tagged_row = self.overlay.get(first + offset)
+                if tagged_row is not None and tagged_row[0] == fields[0]:
+                    fields[2] = tagged_row[1] if tagged_row[1] is not None else ""
+                writer.writerow(fields)
+
+    def export(self):
+        def export():
+            tmp_filename = f"{self.filename}.tmp"
+            with open(tmp_filename, "w", encoding="utf-8", newline="") as f:
+                self._write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            self.index.close()
+            os.replace(tmp_filename, self.filename)
+            self.index = LineIndex(self.filename)
+            self._blocks.clear()
+            # 3-column lines got a tag column
+            self.columns = max(self.columns, 4)
+            self.overlay.clear()
+
+        self.journal.compact(export)
+
+    def close(self):
+        self.journal.close()
+        self.index.close()
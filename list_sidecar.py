@@ -0,0 +1,141 @@
+import json
+import os
+
+import numpy as np
+
+SIDECAR_VERSION = 2
+
+# strings are stored "\0"-joined as one UTF-8 buffer per column
+_TEXT_SEP = "\0"
+
+
+def sidecar_path_for(filename) -> str:
+    return f"{filename}.cols.npz"
+
+
+def source_stat(filename):
+    st = os.stat(filename)
+    return st.st_size, st.st_mtime_ns
+
+
+def _encode_text(values) -> np.ndarray:
+    return np.frombuffer(_TEXT_SEP.join(values).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_text(buffer: np.ndarray, n: int) -> np.ndarray:
+    if n == 0:
+        return np.empty(0, dtype=object)
+    return np.array(buffer.tobytes().decode("utf-8").split(_TEXT_SEP), dtype=object)
+
+
+def write_sidecar(metadata, filename, stat=None) -> bool:
+    """Write ``metadata`` as a columnar sidecar of ``filename``.
+
+    Numeric columns are stored as-is, categoricals and repetitive text
+    columns as codes plus categories, ``PathArray`` columns as their
+    buffers and the rest as one text buffer. Returns False (and writes
+    nothing) for frames that cannot be round-tripped exactly.
+    """
+    import pandas as pd
+    from compact_table import PathDtype
+
+    arrays = {}
+    columns = []
+    for i, col in enumerate(metadata.columns):
+        values = metadata[col]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            arrays[f"{i}.values"] = values.to_numpy()
+            columns.append({"name": col, "kind": "numeric"})
+            continue
+        if isinstance(values.dtype, PathDtype):
+            paths = values.array
+            if not all(_TEXT_SEP not in d for d in paths.dirs):
+                return False
+            arrays[f"{i}.dirs"] = _encode_text(paths.dirs)
+            arrays[f"{i}.codes"] = paths.codes
+            arrays[f"{i}.names"] = paths.names
+            arrays[f"{i}.offsets"] = paths.offsets
+            columns.append({"name": col, "kind": "path", "dirs": len(paths.dirs)})
+            continue
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            uniques = list(values.cat.categories)
+            if not all(isinstance(u, str) and _TEXT_SEP not in u for u in uniques):
+                return False
+            arrays[f"{i}.codes"] = values.cat.codes.to_numpy().astype(np.int32)
+            arrays[f"{i}.categories"] = _encode_text(uniques)
+            columns.append({"name": col, "kind": "category", "categories": len(uniques)})
+            continue
+
+        codes, uniques = pd.factorize(values)
+        uniques = list(uniques)
+        if not all(isinstance(u, str) and _TEXT_SEP not in u for u in uniques):
+            return False
+        if len(uniques) <= len(values) // 2:
+            arrays[f"{i}.codes"] = codes.astype(np.int32)
+            arrays[f"{i}.categories"] = _encode_text(uniques)
+            columns.append({"name": col, "kind": "categorical", "categories": len(uniques)})
+        else:
+            arrays[f"{i}.text"] = _encode_text(values.fillna("").to_numpy())
+            arrays[f"{i}.null"] = np.asarray(codes == -1)
+            columns.append({"name": col, "kind": "text"})
+
+    size, mtime_ns = stat if stat is not None else source_stat(filename)
+    meta = {
+        "version": SIDECAR_VERSION,
+        "source_size": size,
+        "source_mtime_ns": mtime_ns,
+        "rows": len(metadata),
+        "columns": columns,
+    }
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+
+    path = sidecar_path_for(filename)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return True
+
+
+def load_sidecar(filename):
+    """Return the frame stored next to ``filename``, or None if there is no
+    sidecar or ``filename`` changed since it was written."""
+    import pandas as pd
+    from compact_table import PathArray
+
+    path = sidecar_path_for(filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as arrays:
+            meta = json.loads(arrays["meta"].tobytes().decode("utf-8"))
+            if (meta["version"] != SIDECAR_VERSION
+                    or (meta["source_size"], meta["source_mtime_ns"]) != source_stat(filename)):
+                return None
+
+            n = meta["rows"]
+            data = {}
+            for i, column in enumerate(meta["columns"]):
+                kind = column["kind"]
+                if kind == "numeric":
+                    values = arrays[f"{i}.values"]
+                elif kind == "path":
+                    values = PathArray(
+                        _decode_text(arrays[f"{i}.dirs"], column["dirs"]),
+                        arrays[f"{i}.codes"], arrays[f"{i}.names"], arrays[f"{i}.offsets"],
+                    )
+                elif kind == "category":
+                    categories = _decode_text(arrays[f"{i}.categories"], column["categories"])
+                    values = pd.Categorical.from_codes(arrays[f"{i}.codes"], categories)
+                elif kind == "categorical":
+                    categories = _decode_text(arrays[f"{i}.categories"], column["categories"])
+                    # code -1 (missing) picks the appended None
+                    values = np.append(categories, None)[arrays[f"{i}.codes"]]
+                else:
+                    values = _decode_text(arrays[f"{i}.text"], n)
+                    values[arrays[f"{i}.null"]] = None
+                data[column["name"]] = values
+    except (OSError, ValueError, KeyError):
+        # unreadable or half-written sidecar; the text file is the truth
+        return None
+    return pd.DataFrame(data)
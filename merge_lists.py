@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Merge image lists tagged by several annotators.
+
+Rows are joined by filename. Every input is streamed into hash partitions
+on disk and each partition is merged on its own, so memory is bounded by
+the partition size rather than by the lists. The merged list keeps the
+order in which filenames first appear (inputs in the given order) and can
+be opened by the viewer.
+"""
+import argparse
+import csv
+import heapq
+import os
+import sys
+import tempfile
+import zlib
+from collections import Counter, defaultdict
+
+from label_data import COMPARE_COLS, TAGGED_COLS, list_sep
+from tag_journal import TagJournal
+
+PARTITION_BYTES = 64 * 2**20
+
+# how a tag is chosen when annotators disagree
+PREFER_MAJORITY = "majority"
+PREFER_FIRST = "first"
+PREFER_NONE = "none"
+
+
+def read_rows(filename):
+    """(filename, pred, tag, score) of every row; 3-column lists have no
+    tags, and compare columns (see label_data.COMPARE_COLS) are dropped."""
+    with open(filename, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter=list_sep(filename)):
+            if len(row) == 3:
+                yield row[0], row[1], "", row[2]
+            elif 4 <= len(row) <= len(TAGGED_COLS) + len(COMPARE_COLS):
+                yield tuple(row[:4])
+            elif row:
+                raise ValueError(f"{filename}: row has {len(row)} columns, expected 3 to 7")
+
+
+def partition(inputs, tmpdir, partitions):
+    """Stream every input into ``partitions`` files by filename hash."""
+    paths = [os.path.join(tmpdir, f"part-{p}.tsv") for p in range(partitions)]
+    files = [open(path, "w", encoding="utf-8", newline="") for path in paths]
+    try:
+        writers = [csv.writer(f, delimiter="\t", lineterminator="\n") for f in files]
+        seq = 0
+        for k, filename in enumerate(inputs):
+            for name, pred, tag, score in read_rows(filename):
+                p = zlib.crc32(name.encode("utf-8")) % partitions
+                writers[p].writerow((seq, k, name, pred, tag, score))
+                seq += 1
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def tag_counts(tags) -> dict:
+    counts = {}
+    for tag in tags:
+        if tag:
+            counts[tag] = counts.get(tag, 0) + 1
+    return counts
+
+
+def choose_tag(tags, counts, prefer):
+    """Merged tag from the annotators' tags (in input order, "" = untagged)
+    and whether they conflict."""
+    if not counts:
+        return "", False
+    if len(counts) == 1:
+        return next(iter(counts)), False
+    if prefer == PREFER_FIRST:
+        return next(t for t in tags if t), True
+    if prefer == PREFER_MAJORITY:
+        # ties go to the earliest input
+        best = max(counts.values())
+        return next(t for t in tags if t and counts[t] == best), True
+    return "", True
+
+
+class Agreement:
+    """Inter-annotator agreement of one ``pred.`` class.
+
+    Items count once they have at least two tags. ``percent`` is the mean
+    pairwise agreement over those items; ``alpha`` is Krippendorff's alpha
+    for nominal data, which allows a varying number of annotators per
+    item.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.conflicts = 0
+        self.pair_agreement = 0.0
+        self.pairable = 0
+        self.coincident = 0.0
+        self.values = Counter()
+
+    def add(self, counts):
+        """Add one item from the number of annotators per tag."""
+        m = sum(counts.values())
+        if m < 2:
+            return
+        same = sum(c * (c - 1) for c in counts.values())
+        self.items += 1
+        self.conflicts += len(counts) > 1
+        self.pair_agreement += same / (m * (m - 1))
+        self.pairable += m
+        self.coincident += same / (m - 1)
+        for tag, c in counts.items():
+            self.values[tag] += c
+
+    def update(self, other):
+        self.items += other.items
+        self.conflicts += other.conflicts
+        self.pair_agreement += other.pair_agreement
+        self.pairable += other.pairable
+        self.coincident += other.coincident
+        self.values.update(other.values)
+
+    @property
+    def percent(self):
+        return 100.0 * self.pair_agreement / self.items if self.items else float("nan")
+
+    @property
+    def alpha(self):
+        n = self.pairable
+        expected = n * (n - 1) - sum(c * (c - 1) for c in self.values.values())
+        if n < 2 or expected == 0:
+            return float("nan")
+        return 1.0 - (n - 1) * (n - self.coincident) / expected
+
+
+def merge_partition(path, inputs, prefer, agreement):
+    """Merged rows of one partition, sorted by first appearance."""
+    entries = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for seq, k, name, pred, tag, score in csv.reader(f, delimiter="\t"):
+            entry = entries.get(name)
+            if entry is None:
+                entry = entries[name] = [int(seq), pred, score, [""] * len(inputs)]
+            # a filename listed twice by one annotator keeps its last tag
+            entry[3][int(k)] = tag
+
+    rows = []
+    for name, (seq, pred, score, tags) in entries.items():
+        counts = tag_counts(tags)
+        tag, conflict = choose_tag(tags, counts, prefer)
+        agreement[pred].add(counts)
+        rows.append((seq, name, pred, tag, score, int(conflict), *tags))
+    rows.sort()
+    return rows
+
+
+def merge_lists(inputs, output, prefer=PREFER_MAJORITY, report=None, partitions=None):
+    """Merge ``inputs`` into ``output``; returns the per-class agreement
+    and writes the conflicting rows (one tag column per input) to
+    ``report``."""
+    if partitions is None:
+        partitions = max(1, sum(os.path.getsize(f) for f in inputs) // PARTITION_BYTES + 1)
+    agreement = defaultdict(Agreement)
+    out_dir = os.path.dirname(os.path.abspath(output))
+
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix=".merge-") as tmpdir:
+        merged = []
+        for path in partition(inputs, tmpdir, partitions):
+            rows = merge_partition(path, inputs, prefer, agreement)
+            os.remove(path)
+            merged_path = f"{path}.merged"
+            with open(merged_path, "w", encoding="utf-8", newline="") as f:
+                csv.writer(f, delimiter="\t", lineterminator="\n").writerows(rows)
+            merged.append(merged_path)
+
+        files = [open(path, encoding="utf-8", newline="") for path in merged]
+        tmp_output = f"{output}.tmp"
+        try:
+            streams = [csv.reader(f, delimiter="\t") for f in files]
+            with open(tmp_output, "w", encoding="utf-8", newline="") as out, \
+                    open(report or os.devnull, "w", encoding="utf-8", newline="") as rep:
+                out_writer = csv.writer(out, delimiter=list_sep(output), lineterminator="\n")
+                rep_writer = csv.writer(rep, delimiter="\t", lineterminator="\n")
+                rep_writer.writerow(["filename", "pred.", "merged", *inputs])
+                for seq, name, pred, tag, score, conflict, *tags in heapq.merge(
+                        *streams, key=lambda row: int(row[0])):
+                    out_writer.writerow((name, pred, tag, score))
+                    if conflict == "1":
+                        rep_writer.writerow((name, pred, tag, *tags))
+        finally:
+            for f in files:
+                f.close()
+        os.replace(tmp_output, output)
+    return dict(agreement)
+
+
+def print_agreement(agreement, file=sys.stdout):
+    print(f"{'pred.':<12}{'items':>10}{'conflicts':>11}{'agree %':>9}{'alpha':>8}", file=file)
+    total = Agreement()
+    for pred in sorted(agreement, key=str):
+        a = agreement[pred]
+        print(f"{pred:<12}{a.items:>10}{a.conflicts:>11}{a.percent:>9.1f}{a.alpha:>8.3f}", file=file)
+        total.update(a)
+    print(f"{'(all)':<12}{total.items:>10}{total.conflicts:>11}"
+          f"{total.percent:>9.1f}{total.alpha:>8.3f}", file=file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Merge image lists tagged by several annotators.")
+    parser.add_argument("inputs", nargs="+", help="tagged lists (3 or 4 columns)")
+    parser.add_argument("-o", "--output", required=True, help="merged list")
+    parser.add_argument("--prefer", choices=[PREFER_MAJORITY, PREFER_FIRST, PREFER_NONE],
+                        default=PREFER_MAJORITY,
+                        help="tag kept when annotators disagree "
+                             "(majority, the first list's, or none)")
+    parser.add_argument("--report", help="write the conflicting rows to this TSV")
+    parser.add_argument("--partitions", type=int,
+                        help="number of hash partitions (default: one per 64 MB of input)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for filename in args.inputs:
+        if os.path.exists(TagJournal.path_for(filename)):
+            print(f"warning: {filename} has tags that were not exported yet; "
+                  "open it in the viewer (or tag_cli.py) first", file=sys.stderr)
+    agreement = merge_lists(
+        args.inputs, args.output, prefer=args.prefer, report=args.report,
+        partitions=args.partitions,
+    )
+    print_agreement(agreement)
@@ -0,0 +1,102 @@
+import numpy as np
+
+# special values of the tag filter
+ANY = "(all)"
+UNTAGGED = "(untagged)"
+TAGGED = "(tagged)"
+
+SORT_FILE = "file order"
+SORT_SCORE_ASC = "conf. score ↑"
+SORT_SCORE_DESC = "conf. score ↓"
+
+
+class CategoricalIndex:
+    """Per-row int32 codes of a low-cardinality column.
+
+    Predicates compare codes with NumPy instead of touching the Python
+    strings, and changing one row's value is O(1).
+    """
+
+    def __init__(self, values):
+        import pandas as pd
+
+        codes, uniques = pd.factorize(values)
+        self.codes = codes.astype(np.int32)
+        self.values = list(uniques)
+        self._code = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value) -> int:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return -1
+        code = self._code.get(value)
+        if code is None:
+            code = self._code[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def set(self, row: int, value):
+        self.codes[row] = self.code(value)
+
+    def isin(self, values) -> np.ndarray:
+        codes = [self._code[v] for v in values if v in self._code]
+        return np.isin(self.codes, codes)
+
+    def startswith(self, prefix: str) -> np.ndarray:
+        return self.isin([v for v in self.values if v.startswith(prefix)])
+
+    def missing(self) -> np.ndarray:
+        return (self.codes == -1) | self.isin([""])
+
+
+class MetadataFilter:
+    """Vectorized filter/sort over the viewer's ``metadata`` frame.
+
+    ``rows`` returns the positions of the matching rows in display order,
+    or None when nothing is filtered or sorted.
+    """
+
+    def __init__(self, metadata, pred_col, tag_col, score_col):
+        import pandas as pd
+        from compact_table import text_frame
+
+        self.n = len(metadata)
+        self.pred = CategoricalIndex(metadata[pred_col])
+        self.tag = CategoricalIndex(metadata[tag_col])
+        # float32 scores back at the values in the file, so that a bound
+        # equal to a score keeps its row
+        scores = text_frame(metadata[[score_col]])[score_col]
+        self.scores = pd.to_numeric(scores, errors="coerce").to_numpy(np.float64)
+
+    def setTag(self, row, tag):
+        """``row`` may also be an array of positions."""
+        self.tag.set(row, tag)
+
+    def rows(self, pred=ANY, tag=ANY, min_score=None, max_score=None, sort=SORT_FILE):
+        mask = None
+
+        def narrow(m):
+            nonlocal mask
+            mask = m if mask is None else mask & m
+
+        if pred != ANY:
+            narrow(self.pred.isin([pred]))
+        if tag == UNTAGGED:
+            narrow(self.tag.missing())
+        elif tag == TAGGED:
+            narrow(~self.tag.missing())
+        elif tag != ANY:
+            narrow(self.tag.startswith(tag))
+        # NaN scores never satisfy a bound
+        if min_score is not None:
+            narrow(self.scores >= min_score)
+        if max_score is not None:
+            narrow(self.scores <= max_score)
+
+        if mask is None and sort == SORT_FILE:
+            return None
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(self.n)
+        if sort != SORT_FILE:
+            scores = self.scores[rows]
+            order = np.argsort(-scores if sort == SORT_SCORE_DESC else scores, kind="stable")
+            rows = rows[order]
+        return rows
@@ -0,0 +1,97 @@
+import numpy as np
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class MetadataTableModel(QAbstractTableModel):
+    """Read-only table over the viewer's open list (``label_data.LabelList``
+    or ``line_index.StreamingList``).
+
+    Cells are read and formatted on demand in ``data``, so only the visible
+    rows cost anything; nothing is copied out of the list. ``setRows``
+    limits and orders the visible rows; view rows map to list positions
+    through ``position``/``viewRow``.
+    """
+
+    def __init__(self, filename_col: str, parent=None):
+        super().__init__(parent)
+        self.filename_col = filename_col
+        self._labels = None
+        self._columns = []
+        self._rows = None
+        self._view_rows = None
+
+    def setList(self, labels, columns):
+        self.beginResetModel()
+        self._labels = labels
+        self._columns = list(columns) if labels is not None else []
+        self._rows = None
+        self._view_rows = None
+        self.endResetModel()
+
+    def setRows(self, rows):
+        """Show only the list positions in ``rows``, in that order (None
+        shows every row)."""
+        self.beginResetModel()
+        self._rows = rows
+        self._view_rows = None
+        self.endResetModel()
+
+    def position(self, view_row: int) -> int:
+        return int(self._rows[view_row]) if self._rows is not None else view_row
+
+    def positions(self, view_rows) -> np.ndarray:
+        view_rows = np.asarray(view_rows, dtype=np.int64)
+        return self._rows[view_rows] if self._rows is not None else view_rows
+
+    def viewRow(self, position: int) -> int:
+        if self._rows is None:
+            return position
+        if self._view_rows is None:
+            self._view_rows = np.full(len(self._labels), -1, dtype=np.int64)
+            self._view_rows[self._rows] = np.arange(len(self._rows))
+        return int(self._view_rows[position])
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid() or self._labels is None:
+            return 0
+        return len(self._rows) if self._rows is not None else len(self._labels)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        value = self._labels.value(self.position(index.row()), self._columns[index.column()])
+        return "" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section]
+        return str(self.position(section))
+
+    def filename(self, view_row: int) -> str:
+        return self._labels.value(self.position(view_row), self.filename_col)
+
+    def rowChanged(self, position: int):
+        row = self.viewRow(position)
+        if row >= 0:
+            self.dataChanged.emit(
+                self.index(row, 0), self.index(row, self.columnCount() - 1)
+            )
+
+    def rowsChanged(self, positions):
+        if len(positions) == 1:
+            self.rowChanged(positions[0])
+        elif self.rowCount() > 0:
+            # views only repaint what is visible, so one signal for the whole
+            # table is cheaper than one per row
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(self.rowCount() - 1, self.columnCount() - 1),
+            )
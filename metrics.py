@@ -0,0 +1,140 @@
+import bisect
+import csv
+import heapq
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds of the histogram buckets: 0.5 ms doubling up to ~9 min
+BUCKET_BOUNDS = [0.0005 * 2**k for k in range(21)]
+
+# slowest samples kept per operation, with what they were about
+SLOWEST = 10
+
+
+class LatencyHistogram:
+    """Log-scale histogram of one operation's latencies (seconds)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slowest = []
+
+    def add(self, seconds: float, detail=None):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if detail is not None:
+            entry = (seconds, str(detail))
+            if len(self.slowest) < SLOWEST:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float("nan")
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q``-th percentile."""
+        if not self.count:
+            return float("nan")
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean if self.count else None,
+            "p50": self.percentile(50) if self.count else None,
+            "p95": self.percentile(95) if self.count else None,
+            "max": self.max,
+            "buckets": self.counts,
+            "slowest": sorted(self.slowest, reverse=True),
+        }
+
+
+class SessionMetrics:
+    """Latencies and labeling rate of one viewer session.
+
+    Operations are timed with ``timer`` (or ``record``) from any thread;
+    ``labeled`` counts tagged rows. ``write`` exports everything as JSON,
+    or the summary table as CSV.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.histograms = {}
+        self.labels = []
+        self._lock = threading.Lock()
+
+    def record(self, op: str, seconds: float, detail=None):
+        with self._lock:
+            histogram = self.histograms.get(op)
+            if histogram is None:
+                histogram = self.histograms[op] = LatencyHistogram()
+            histogram.add(seconds, detail)
+
+    @contextmanager
+    def timer(self, op: str, detail=None):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(op, time.perf_counter() - t0, detail)
+
+    def labeled(self, rows: int):
+        with self._lock:
+            self.labels.append((time.time(), rows))
+
+    def labels_per_minute(self, window=None) -> float:
+        """Rows tagged per minute over the session, or over the last
+        ``window`` seconds."""
+        now = time.time()
+        since = self.started if window is None else max(self.started, now - window)
+        with self._lock:
+            rows = sum(n for t, n in self.labels if t >= since)
+        minutes = (now - since) / 60.0
+        return rows / minutes if minutes > 0 else 0.0
+
+    def summary(self):
+        """(op, count, mean, p50, p95, max) per operation, in seconds."""
+        with self._lock:
+            return [
+                (op, h.count, h.mean, h.percentile(50), h.percentile(95), h.max)
+                for op, h in sorted(self.histograms.items())
+            ]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            histograms = {op: h.to_dict() for op, h in sorted(self.histograms.items())}
+            labeled = sum(n for _, n in self.labels)
+        return {
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "labeled": labeled,
+            "labels_per_minute": self.labels_per_minute(),
+            "bucket_bounds": BUCKET_BOUNDS,
+            "operations": histograms,
+        }
+
+    def write(self, path: str):
+        if path.lower().endswith(".csv"):
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["op", "count", "mean_ms", "p50_ms", "p95_ms", "max_ms"])
+                for op, count, *seconds in self.summary():
+                    writer.writerow([op, count, *(f"{s * 1000:.2f}" for s in seconds)])
+                writer.writerow(["labels_per_minute", "", f"{self.labels_per_minute():.2f}"])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
@@ -0,0 +1,125 @@
+import heapq
+import math
+
+import numpy as np
+
+from label_data import MAIN_TAG_FALSE, MAIN_TAG_TRUE
+
+# weights of the parts of a row's priority
+WEIGHT_UNCERTAINTY = 1.0
+WEIGHT_ERROR_RATE = 0.5
+WEIGHT_RARITY = 0.25
+
+_UNTAGGED, _RIGHT, _WRONG, _OTHER = 0, 1, 2, 3
+
+
+def verdicts(tags) -> np.ndarray:
+    """Per-tag verdict on the prediction: untagged, right, wrong or other."""
+    import pandas as pd
+
+    tags = pd.Series(tags, dtype=object).fillna("").astype(str)
+    result = np.full(len(tags), _OTHER, dtype=np.int8)
+    result[(tags == "").to_numpy()] = _UNTAGGED
+    result[tags.str.startswith(MAIN_TAG_TRUE).to_numpy()] = _RIGHT
+    result[tags.str.startswith(MAIN_TAG_FALSE).to_numpy()] = _WRONG
+    return result
+
+
+class PriorityOrder:
+    """Untagged rows, most informative first.
+
+    A row's priority is its uncertainty (1 - conf. score; rows without a
+    score count as fully uncertain) plus two bonuses of its ``pred.``
+    class: how often the class was tagged wrong so far, and how rare it
+    is. Within a class the order only depends on the score, so every class
+    keeps its rows sorted once and a heap holds the head of each class.
+    Tags change the error rate of their class, which re-queues that class;
+    rows that were tagged elsewhere are dropped when they come up.
+    """
+
+    def __init__(self, metadata, pred_col, tag_col, score_col):
+        import pandas as pd
+
+        codes, self.classes = pd.factorize(metadata[pred_col], use_na_sentinel=False)
+        self.codes = codes.astype(np.int32)
+        scores = pd.to_numeric(metadata[score_col], errors="coerce")
+        if scores.max() > 1:
+            # percentages
+            scores = scores / scores.max()
+        self.uncertainty = (1.0 - scores.clip(0.0, 1.0)).fillna(1.0).to_numpy(np.float64)
+        self.verdict = verdicts(metadata[tag_col])
+        # rows tagged or already handed out
+        self.done = self.verdict != _UNTAGGED
+
+        n_classes = len(self.classes)
+        counts = np.bincount(self.codes, minlength=n_classes)
+        most = counts.max(initial=1)
+        self.rarity = (
+            1.0 - np.log(counts) / math.log(most) if most > 1 else np.zeros(n_classes)
+        )
+        self.right = np.bincount(self.codes[self.verdict == _RIGHT], minlength=n_classes)
+        self.wrong = np.bincount(self.codes[self.verdict == _WRONG], minlength=n_classes)
+
+        order = np.lexsort((-self.uncertainty, self.codes))
+        starts = np.searchsorted(self.codes[order], np.arange(n_classes))
+        self._rows = np.split(order, starts[1:])
+        self._cursor = np.zeros(n_classes, dtype=np.int64)
+        self._version = np.zeros(n_classes, dtype=np.int64)
+        self._heap = []
+        for c in range(n_classes):
+            self._push(c)
+
+    def bonus(self, c: int) -> float:
+        # Laplace-smoothed, so classes nobody has tagged yet start at 0.5
+        error_rate = (self.wrong[c] + 1) / (self.right[c] + self.wrong[c] + 2)
+        return WEIGHT_ERROR_RATE * error_rate + WEIGHT_RARITY * self.rarity[c]
+
+    def priorities(self) -> np.ndarray:
+        """Current priority of every row."""
+        bonuses = np.array([self.bonus(c) for c in range(len(self.classes))])
+        return WEIGHT_UNCERTAINTY * self.uncertainty + bonuses[self.codes]
+
+    def _push(self, c: int):
+        # entries pushed before this one are stale from now on
+        self._version[c] += 1
+        rows, cursor = self._rows[c], self._cursor[c]
+        while cursor < len(rows) and self.done[rows[cursor]]:
+            cursor += 1
+        self._cursor[c] = cursor
+        if cursor < len(rows):
+            priority = WEIGHT_UNCERTAINTY * self.uncertainty[rows[cursor]] + self.bonus(c)
+            heapq.heappush(self._heap, (-priority, rows[cursor], c, self._version[c]))
+
+    def next(self):
+        """Hand out the untagged row with the highest priority (None once
+        every row is tagged or was handed out)."""
+        while self._heap:
+            _, row, c, version = heapq.heappop(self._heap)
+            if version != self._version[c]:
+                continue
+            if self.done[row]:
+                self._push(c)
+                continue
+            self.done[row] = True
+            self._push(c)
+            return int(row)
+        return None
+
+    def tagged(self, positions, tag):
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return
+        n_classes = len(self.classes)
+        codes = self.codes[positions]
+        old = self.verdict[positions]
+        self.right -= np.bincount(codes[old == _RIGHT], minlength=n_classes)
+        self.wrong -= np.bincount(codes[old == _WRONG], minlength=n_classes)
+        new = verdicts([tag])[0]
+        self.verdict[positions] = new
+        if new == _RIGHT:
+            self.right += np.bincount(codes, minlength=n_classes)
+        elif new == _WRONG:
+            self.wrong += np.bincount(codes, minlength=n_classes)
+        self.done[positions] = True
+        for c in np.unique(codes):
+            self._push(int(c))
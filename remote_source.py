@@ -0,0 +1,248 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import paramiko
+
+# a downloaded file whose remote size and mtime were checked this recently
+# is served without asking the host again
+VALIDATE_SECONDS = 300
+
+
+def parse_remote(remote: str):
+    """Split ``[user@]host[:port]`` into its parts."""
+    username, _, hostport = remote.rpartition("@")
+    host, _, port = hostport.partition(":")
+    return host, int(port) if port else None, username or None
+
+
+class SFTPPool:
+    """One persistent SSH connection with a pool of SFTP sessions on it.
+
+    The SSH handshake happens once; every ``session`` borrows an SFTP
+    channel multiplexed over the same transport, so concurrent workers do
+    not block each other and nothing reconnects per image.
+    """
+
+    def __init__(self, host, port=None, username=None, size=4):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.size = size
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect_kwargs(self):
+        kwargs = {"hostname": self.host, "port": self.port or 22, "username": self.username}
+        config_path = os.path.expanduser("~/.ssh/config")
+        if os.path.exists(config_path):
+            config = paramiko.SSHConfig.from_path(config_path).lookup(self.host)
+            kwargs["hostname"] = config.get("hostname", self.host)
+            if self.port is None and "port" in config:
+                kwargs["port"] = int(config["port"])
+            if self.username is None:
+                kwargs["username"] = config.get("user")
+            if "identityfile" in config:
+                kwargs["key_filename"] = config["identityfile"]
+        return kwargs
+
+    def _close_idle(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _transport(self):
+        with self._lock:
+            if self._client is None or not self._client.get_transport().is_active():
+                if self._client is not None:
+                    self._close_idle()
+                    self._client.close()
+                client = paramiko.SSHClient()
+                client.load_system_host_keys()
+                client.set_missing_host_key_policy(paramiko.RejectPolicy())
+                client.connect(**self._connect_kwargs())
+                client.get_transport().set_keepalive(30)
+                self._client = client
+            return self._client
+
+    @contextmanager
+    def session(self):
+        with self._slots:
+            client = self._transport()
+            try:
+                sftp = self._idle.get_nowait()
+            except queue.Empty:
+                sftp = client.open_sftp()
+            reusable = False
+            try:
+                yield sftp
+                reusable = True
+            except FileNotFoundError:
+                # a missing file leaves the channel usable, anything else
+                # (dropped connection) may not
+                reusable = True
+                raise
+            finally:
+                # a channel of a connection replaced meanwhile is dead too
+                if reusable and client is self._client:
+                    self._idle.put(sftp)
+                else:
+                    sftp.close()
+
+    def close(self):
+        with self._lock:
+            self._close_idle()
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+class DiskCache:
+    """Size-bounded on-disk cache of downloaded files.
+
+    Files are addressed by a hash of the remote path, size and mtime, so a
+    remote file that changes gets a new entry. The least recently used
+    files are removed once the total size exceeds the budget. Use order is
+    kept in memory (the files are not touched, so their mtimes stay valid
+    cache keys) and saved to ``ORDER_FILE`` by ``save``; files downloaded
+    after the last save count as the most recent, by mtime.
+    """
+
+    ORDER_FILE = "order.txt"
+
+    def __init__(self, root, budget_bytes=4 * 2**30):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.size_bytes = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _read_order(self) -> dict:
+        try:
+            with open(os.path.join(self.root, self.ORDER_FILE), encoding="utf-8") as f:
+                return {line.rstrip("\n"): rank for rank, line in enumerate(f)}
+        except OSError:
+            return {}
+
+    def _scan(self):
+        order = self._read_order()
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if dirpath == self.root and name.startswith(self.ORDER_FILE):
+                    continue
+                if name.endswith(".part"):
+                    # download interrupted by a crash
+                    os.remove(path)
+                    continue
+                st = os.stat(path)
+                rank = order.get(os.path.relpath(path, self.root))
+                key = (0, rank) if rank is not None else (1, st.st_mtime_ns)
+                files.append((key, path, st.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self.size_bytes += size
+
+    @staticmethod
+    def address(*parts) -> str:
+        return hashlib.sha1("\0".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+    def path_for(self, address: str, suffix: str = "") -> str:
+        return os.path.join(self.root, address[:2], address + suffix)
+
+    def get(self, path: str):
+        with self._lock:
+            if path not in self._entries:
+                return None
+            if not os.path.exists(path):
+                # removed behind our back
+                self.size_bytes -= self._entries.pop(path)
+                return None
+            self._entries.move_to_end(path)
+        return path
+
+    def put(self, path: str, tmp_path: str):
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.size_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self.size_bytes > self.budget_bytes and len(self._entries) > 1:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+        return path
+
+    def save(self):
+        """Write the use order, least recent first."""
+        with self._lock:
+            paths = [os.path.relpath(path, self.root) for path in self._entries]
+        order_path = os.path.join(self.root, self.ORDER_FILE)
+        tmp_path = f"{order_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{path}\n" for path in paths)
+            os.replace(tmp_path, order_path)
+        except OSError:
+            pass
+
+
+class RemoteImageSource:
+    """Serves remote images as local files through ``DiskCache``."""
+
+    def __init__(self, remote: str, cache_dir: str, cache_budget_bytes=4 * 2**30,
+                 connections=4):
+        host, port, username = parse_remote(remote)
+        self.remote = remote
+        self.pool = SFTPPool(host, port, username, size=connections)
+        self.cache = DiskCache(cache_dir, cache_budget_bytes)
+        # remote path -> (local path, time its remote stat was last checked)
+        self._local = {}
+
+    def local_path(self, remote_path: str):
+        """Local copy of ``remote_path`` if it was fetched before; never
+        touches the network."""
+        path, _ = self._local.get(remote_path, (None, None))
+        return self.cache.get(path) if path is not None else None
+
+    def mtime(self, remote_path: str) -> int:
+        with self.pool.session() as sftp:
+            return int(sftp.stat(remote_path).st_mtime) * 10**9
+
+    def fetch(self, remote_path: str) -> str:
+        path, validated = self._local.get(remote_path, (None, None))
+        if (path is not None and time.monotonic() - validated < VALIDATE_SECONDS
+                and self.cache.get(path) is not None):
+            return path
+        with self.pool.session() as sftp:
+            st = sftp.stat(remote_path)
+            address = DiskCache.address(self.remote, remote_path, st.st_size, st.st_mtime)
+            path = self.cache.path_for(address, os.path.splitext(remote_path)[1])
+            if self.cache.get(path) is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.part"
+                # SFTPClient.get pipelines its read requests
+                sftp.get(remote_path, tmp_path)
+                self.cache.put(path, tmp_path)
+        self._local[remote_path] = (path, time.monotonic())
+        return path
+
+    def close(self):
+        self.pool.close()
+        self.cache.save()
@@ -0,0 +1,55 @@
+import builtins
+import sys
+import time
+
+
+class StartupTiming:
+    """Time of the imports and start-up phases of a program.
+
+    ``install`` wraps ``__import__`` and records, like ``-X importtime``,
+    how long each module took to import including the modules it imported
+    itself; ``mark`` records a phase. ``report`` prints both.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.imports = []
+        self.marks = []
+        self._depth = 0
+        self._import = None
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return self
+
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._depth += 1
+        t0 = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.imports.append((self._depth, name, time.perf_counter() - t0))
+
+    def mark(self, phase: str):
+        self.marks.append((phase, time.perf_counter() - self.start))
+
+    def report(self, file=None, top=15, depth=1):
+        file = file or sys.stderr
+        imports = sorted(
+            (i for i in self.imports if i[0] < depth), key=lambda i: i[2], reverse=True
+        )
+        print("imports (cumulative):", file=file)
+        for _, name, seconds in imports[:top]:
+            print(f"  {seconds * 1000:8.1f} ms  {name}", file=file)
+        print("phases (since start):", file=file)
+        for phase, seconds in self.marks:
+            print(f"  {seconds * 1000:8.1f} ms  {phase}", file=file)
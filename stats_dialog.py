@@ -0,0 +1,78 @@
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import (
+    QDialog, QFileDialog, QHBoxLayout, QHeaderView, QLabel, QPushButton, QTableWidget,
+    QTableWidgetItem, QVBoxLayout,
+)
+
+# labels/min is also shown over this recent window (seconds)
+RECENT_WINDOW = 5 * 60
+
+
+class SessionStatsDialog(QDialog):
+    """Latencies and labeling rate of a ``metrics.SessionMetrics``,
+    refreshed while the dialog is open."""
+
+    COLUMNS = ["operation", "count", "mean ms", "p50 ms", "p95 ms", "max ms"]
+
+    def __init__(self, metrics, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.setWindowTitle("Session Stats")
+
+        self.rateLabel = QLabel()
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        exportButton = QPushButton("&Export...")
+        exportButton.clicked.connect(self.export)
+        closeButton = QPushButton("&Close")
+        closeButton.clicked.connect(self.close)
+        buttons = QHBoxLayout()
+        buttons.addStretch(1)
+        buttons.addWidget(exportButton)
+        buttons.addWidget(closeButton)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.rateLabel)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        self.resize(560, 320)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(2000)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        self.rateLabel.setText(
+            f"labels/min: {self.metrics.labels_per_minute():.1f} (session), "
+            f"{self.metrics.labels_per_minute(RECENT_WINDOW):.1f} (last 5 min)"
+        )
+        summary = self.metrics.summary()
+        self.table.setRowCount(len(summary))
+        for row, (op, count, *seconds) in enumerate(summary):
+            cells = [op, str(count)] + [f"{s * 1000:.1f}" for s in seconds]
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if column > 0:
+                    item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def export(self):
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Export Session Stats", "session_stats.json", "JSON (*.json);;CSV (*.csv)"
+        )
+        if filename:
+            self.metrics.write(filename)
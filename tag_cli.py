@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Tag an image list with rules, without the GUI.
+
+A rule file is a JSON list of rules, applied in order::
+
+    [
+        {"where": "filename.str.split('/').str[-2] == `pred.`", "tag": "맞"},
+        {"where": "`conf. score` < 0.3", "tag": "틀low", "overwrite": true}
+    ]
+
+``where`` is a pandas expression over the list's columns (``filename``,
+``pred.``, ``tag``, ``conf. score``; quote names with backticks). Rows
+that already have a tag are skipped unless ``overwrite`` is set. Tags are
+journaled like tags set in the viewer and the list is rewritten once at
+the end.
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from compact_table import assign
+from label_data import LabelList, FILENAME_COL, TAG_COL
+
+
+def load_rules(filename):
+    with open(filename, encoding="utf-8") as f:
+        rules = json.load(f)
+    if isinstance(rules, dict):
+        rules = [rules]
+    for i, rule in enumerate(rules):
+        if not isinstance(rule, dict) or "where" not in rule or "tag" not in rule:
+            raise ValueError(f"{filename}: rule {i} needs 'where' and 'tag'")
+    return rules
+
+
+def rule_rows(metadata, rule, filenames=None) -> np.ndarray:
+    """Rows matching ``rule``; ``filenames`` (the filename column as
+    plain strings) lets expressions use ``.str`` on it."""
+    frame = metadata if filenames is None else metadata.assign(**{FILENAME_COL: filenames})
+    mask = frame.eval(rule["where"], engine="python")
+    if not isinstance(mask, pd.Series) or not pd.api.types.is_bool_dtype(mask):
+        raise ValueError(f"'where' is not a row predicate: {rule['where']}")
+    mask = mask.to_numpy(dtype=bool, na_value=False)
+    if not rule.get("overwrite", False):
+        tags = metadata[TAG_COL]
+        mask = mask & (tags.isna() | (tags == "")).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def apply_rules(labels: LabelList, rules, dry_run=False):
+    """Apply ``rules`` in order; returns the number of rows each one tagged."""
+    # a dry run tags a copy, so later rules still see the earlier ones
+    metadata = labels.metadata.copy() if dry_run else labels.metadata
+    filenames = metadata[FILENAME_COL].astype(object)
+    counts = []
+    for rule in rules:
+        rows = rule_rows(metadata, rule, filenames)
+        if len(rows):
+            if dry_run:
+                assign(metadata, TAG_COL, rows, rule["tag"])
+            else:
+                labels.tag_rows(rows, rule["tag"])
+        counts.append(len(rows))
+    return counts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tag an image list with rule files.")
+    parser.add_argument("list", help="image list (.txt/.tsv/.csv) to tag")
+    parser.add_argument("rules", nargs="+", help="JSON rule files, applied in order")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="only report how many rows every rule would tag")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rules = [rule for filename in args.rules for rule in load_rules(filename)]
+
+    # a dry run must leave the list, its journal and its sidecar untouched
+    labels = LabelList(args.list, read_only=args.dry_run)
+    try:
+        counts = apply_rules(labels, rules, dry_run=args.dry_run)
+    finally:
+        labels.close()
+
+    for rule, count in zip(rules, counts):
+        print(f"{count:>10}  {rule['tag']!r:<12} {rule['where']}")
+    print(f"{sum(counts):>10}  of {len(labels)} rows{' (dry run)' if args.dry_run else ''}")
@@ -0,0 +1,201 @@
+import json
+from json.encoder import encode_basestring
+import os
+import threading
+import time
+
+
+def atomic_write_table(metadata, filename, sep):
+    from compact_table import text_frame
+
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w", encoding="utf-8", newline="") as f:
+        text_frame(metadata).to_csv(f, sep=sep, index=False, header=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+class TagJournal:
+    """Append-only log of tag changes for one image list.
+
+    Every tag change is written as one JSON line and flushed to the OS right
+    away; ``fsync`` is batched (every ``sync_every`` records or
+    ``sync_interval`` seconds). The full list is only rewritten on
+    compaction, after which the compacted records are dropped from the
+    journal. Several viewers of one list (see work_queue) share the
+    journal; one that finds it replaced by another's compaction reopens
+    it.
+    """
+
+    def __init__(self, filename, sync_every=32, sync_interval=1.0):
+        self.path = self.path_for(filename)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._fp = open(self.path, "a", encoding="utf-8")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._compactor = None
+        self.records = self._count_records()
+
+    @staticmethod
+    def path_for(filename) -> str:
+        return f"{filename}.journal"
+
+    @staticmethod
+    def read_records(filename):
+        path = TagJournal.path_for(filename)
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write from a crash; everything before it is intact
+                    break
+                yield record
+
+    @staticmethod
+    def replay(metadata, filename, filename_col, tag_col) -> int:
+        latest = {}
+        for record in TagJournal.read_records(filename):
+            latest[(record["row"], record["filename"])] = record["tag"]
+        if not latest:
+            return 0
+
+        # row lookups only: converting the whole column would cost more
+        filenames = metadata[filename_col].array
+        positions = None
+        rows, tags = [], []
+        for (row, record_filename), tag in latest.items():
+            if not (0 <= row < len(filenames) and filenames[row] == record_filename):
+                # the list was edited since the record was written
+                if positions is None:
+                    positions = {f: i for i, f in enumerate(filenames.tolist())}
+                row = positions.get(record_filename)
+                if row is None:
+                    continue
+            rows.append(row)
+            tags.append(tag)
+
+        from compact_table import assign
+
+        by_tag = {}
+        for row, tag in zip(rows, tags):
+            by_tag.setdefault(tag, []).append(row)
+        for tag, tag_rows in by_tag.items():
+            assign(metadata, tag_col, tag_rows, tag)
+        return len(rows)
+
+    def _count_records(self) -> int:
+        with open(self.path, encoding="utf-8") as f:
+            return sum(1 for _ in f)
+
+    def append(self, row: int, filename: str, tag: str):
+        self.extend([row], [filename], tag)
+
+    def extend(self, rows, filenames, tag: str):
+        """Log ``tag`` for every row in ``rows`` with one write."""
+        # same lines as json.dumps(..., ensure_ascii=False) would write,
+        # without encoding the constant parts once per row
+        suffix = f', "tag": {encode_basestring(tag) if tag is not None else "null"}}}\n'
+        records = "".join(
+            f'{{"row": {int(row)}, "filename": {encode_basestring(filename)}{suffix}'
+            for row, filename in zip(rows, filenames)
+        )
+        if not records:
+            return
+        with self._lock:
+            self._reopen_if_replaced()
+            self._fp.write(records)
+            self._fp.flush()
+            self._pending += 1
+            self.records += len(rows)
+            if (self._pending >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync()
+
+    def sync(self):
+        with self._lock:
+            if self._pending:
+                self._sync()
+
+    def _reopen_if_replaced(self):
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._fp.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self._sync()
+            self._fp.close()
+            self._fp = open(self.path, "a", encoding="utf-8")
+            self.records = self._count_records()
+
+    def _sync(self):
+        os.fsync(self._fp.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def is_compacting(self) -> bool:
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def compact(self, write_fn, background=False):
+        """Run ``write_fn`` (which persists a snapshot of the full list) and
+        drop the journal records the snapshot already contains."""
+        self.wait()
+        with self._lock:
+            self._reopen_if_replaced()
+            self._sync()
+            offset = self._fp.tell()
+            if offset == 0:
+                return
+
+        def run():
+            write_fn()
+            self._truncate(offset)
+
+        if background:
+            self._compactor = threading.Thread(
+                target=run, name="tag-journal-compaction", daemon=True
+            )
+            self._compactor.start()
+        else:
+            run()
+
+    def _truncate(self, offset: int):
+        with self._lock:
+            self._fp.close()
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
+            except FileNotFoundError:
+                # another viewer of the same list compacted it away
+                tail = b""
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._fp = open(self.path, "a", encoding="utf-8")
+            self.records = tail.count(b"\n")
+
+    def wait(self):
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+    def close(self):
+        self.wait()
+        with self._lock:
+            self._sync()
+            self._fp.close()
+        try:
+            if os.path.getsize(self.path) == 0:
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,27 @@
+from compact_table import text_frame
+from label_data import TAGGED_COLS, read_list
+from line_index import STRIDE, StreamingList
+
+
+def test_streamed_rows_match_read_list(tmp_path):
+    lines = []
+    for i in range(3 * STRIDE + 5):
+        lines.append(f"imgs/{i:04d}.jpg\tP\t\t0.{i:04d}")
+        # blank lines, some on block boundaries, are not rows in either
+        if i % 17 == 0 or i == STRIDE - 1:
+            lines.append("")
+    path = tmp_path / "list.txt"
+    path.write_text("\n" + "\n".join(lines) + "\n\n", encoding="utf-8")
+    filename = str(path)
+
+    # float32 scores compared at the values they were read as
+    metadata = text_frame(read_list(filename))
+    rows = StreamingList(filename)
+    try:
+        assert len(rows) == len(metadata) == 3 * STRIDE + 5
+        for i in (0, STRIDE - 1, STRIDE, 2 * STRIDE + 1, len(rows) - 1):
+            streamed = rows.row(i)
+            assert streamed[TAGGED_COLS[0]] == metadata.iloc[i, 0] == f"imgs/{i:04d}.jpg"
+            assert streamed[TAGGED_COLS[3]] == metadata.iloc[i, 3]
+    finally:
+        rows.close()
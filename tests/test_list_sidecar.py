@@ -0,0 +1,64 @@
+import numpy as np
+
+from compact_table import PathDtype, text_frame
+from label_data import FILENAME_COL, SCORE_COL, TAG_COL, LabelList
+from list_sidecar import load_sidecar
+
+
+def write_list(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def open_twice(filename):
+    """The list as read from text, then as reopened from its sidecar."""
+    first = LabelList(filename)
+    first.wait_sidecar()
+    first.journal.close()
+    assert load_sidecar(filename) is not None
+    second = LabelList(filename, read_only=True)
+    return first, second
+
+
+def test_integer_scores_round_trip(tmp_path):
+    lines = ["imgs/a.jpg\tP\t맞\t1", "imgs/b.jpg\tN\t\t20", "imgs/c.jpg\tP\t틀\t300"]
+    filename = write_list(tmp_path / "list.txt", lines)
+
+    first, second = open_twice(filename)
+
+    assert second.metadata[SCORE_COL].dtype == np.int64
+    assert second.metadata[SCORE_COL].tolist() == [1, 20, 300]
+    assert isinstance(second.metadata[FILENAME_COL].dtype, PathDtype)
+    for i in range(len(lines)):
+        assert second.row(i) == first.row(i)
+
+
+def test_float32_scores_round_trip(tmp_path):
+    lines = ["imgs/a.jpg\tP\t맞\t0.1", "imgs/b.jpg\tN\t\t0.123456", "imgs/c.jpg\tP\t틀\t0.9"]
+    filename = write_list(tmp_path / "list.txt", lines)
+
+    first, second = open_twice(filename)
+
+    assert second.metadata[SCORE_COL].dtype == np.float32
+    restored = text_frame(second.metadata)[SCORE_COL]
+    assert restored.tolist() == [0.1, 0.123456, 0.9]
+    assert [second.value(i, TAG_COL) for i in range(3)] == ["맞", None, "틀"]
+
+
+def test_export_writes_scores_as_read(tmp_path):
+    lines = [
+        "imgs/a.jpg\tP\t맞\t0.1", "imgs/b.jpg\tN\t\t0.123456", "imgs/c.jpg\tP\t틀\t0.9",
+    ]
+    filename = write_list(tmp_path / "list.txt", lines)
+    _, second = open_twice(filename)
+
+    labels = LabelList(filename)
+    labels.tag_rows([1], "틀")
+    labels.close()
+
+    lines[1] = "imgs/b.jpg\tN\t틀\t0.123456"
+    assert (tmp_path / "list.txt").read_text(encoding="utf-8").splitlines() == lines
+    # the sidecar written by close matches the exported list
+    reopened = LabelList(filename, read_only=True)
+    assert reopened.metadata[SCORE_COL].dtype == np.float32
+    assert reopened.value(1, TAG_COL) == "틀"
@@ -0,0 +1,69 @@
+import json
+
+from label_data import FILENAME_COL, TAG_COL, LabelList
+from line_index import StreamingList
+from tag_journal import TagJournal
+
+
+def write_list(path, rows):
+    path.write_text("".join("\t".join(row) + "\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+
+def crashed_journal(filename):
+    """A journal with two complete records and a torn third one, as left
+    by a crash in the middle of a write."""
+    journal = TagJournal(filename)
+    journal.append(0, "imgs/a.jpg", "맞")
+    journal.append(2, "imgs/c.jpg", "틀")
+    journal.close()
+    with open(TagJournal.path_for(filename), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"row": 1, "filename": "imgs/b.jpg", "tag": "맞"})[:20])
+
+
+def test_read_records_stops_at_torn_line(tmp_path):
+    filename = write_list(tmp_path / "list.txt", [("imgs/a.jpg", "P", "0.5")])
+    crashed_journal(filename)
+
+    records = list(TagJournal.read_records(filename))
+
+    assert [(r["row"], r["tag"]) for r in records] == [(0, "맞"), (2, "틀")]
+
+
+def test_label_list_replays_journal_after_crash(tmp_path):
+    filename = write_list(tmp_path / "list.txt", [
+        ("imgs/a.jpg", "P", "0.5"), ("imgs/b.jpg", "P", "0.6"), ("imgs/c.jpg", "N", "0.7"),
+    ])
+    crashed_journal(filename)
+
+    labels = LabelList(filename, read_only=True)
+
+    assert labels.replayed == 2
+    assert [labels.value(i, TAG_COL) for i in range(3)] == ["맞", None, "틀"]
+
+
+def test_replay_follows_moved_rows(tmp_path):
+    # the list was edited after the records were written: row 0 is now c.jpg
+    filename = write_list(tmp_path / "list.txt", [
+        ("imgs/c.jpg", "N", "0.7"), ("imgs/a.jpg", "P", "0.5"),
+    ])
+    crashed_journal(filename)
+
+    labels = LabelList(filename, read_only=True)
+
+    assert [labels.value(i, FILENAME_COL) for i in range(2)] == ["imgs/c.jpg", "imgs/a.jpg"]
+    assert [labels.value(i, TAG_COL) for i in range(2)] == ["틀", "맞"]
+
+
+def test_streaming_list_replays_journal_after_crash(tmp_path):
+    filename = write_list(tmp_path / "list.txt", [
+        ("imgs/a.jpg", "P", "0.5"), ("imgs/b.jpg", "P", "0.6"), ("imgs/c.jpg", "N", "0.7"),
+    ])
+    crashed_journal(filename)
+
+    rows = StreamingList(filename)
+    try:
+        assert rows.replayed == 2
+        assert [rows.row(i)[TAG_COL] for i in range(3)] == ["맞", None, "틀"]
+    finally:
+        rows.close()
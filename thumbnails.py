@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import (
+    Qt, QObject, QRunnable, QThreadPool, QBuffer, QIODevice, QIdentityProxyModel,
+    pyqtSignal,
+)
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem
+
+from image_loader import decode_image
+
+THUMBNAIL_SIZE = 128
+# stored thumbnails of remote images are checked against the remote mtime
+# after every visible thumbnail has been looked up
+REVALIDATE_PRIORITY = 0
+
+
+class ThumbnailStore:
+    """Encoded thumbnails in one SQLite file, keyed by image path.
+
+    Each thumbnail is stored with the image's mtime, so that edited images
+    get a fresh one.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL,"
+            " size INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+
+    def lookup(self, path: str, size: int):
+        """(mtime_ns, data) of the stored thumbnail of ``path``, whatever
+        the image's current mtime, or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT mtime_ns, data FROM thumbnails WHERE path = ? AND size = ?",
+                (path, size),
+            ).fetchone()
+
+    def put(self, path: str, mtime_ns: int, size: int, data: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)",
+                (path, mtime_ns, size, data),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def encode_thumbnail(image: QImage) -> bytes:
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "JPG", 85)
+    return bytes(buffer.data())
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, loader, filename: str, revalidate=False):
+        super().__init__()
+        self.loader = loader
+        self.filename = filename
+        self.revalidate = revalidate
+        self.started = False
+
+    def run(self):
+        self.started = True
+        loader = self.loader
+        try:
+            stored = loader.store.lookup(self.filename, loader.size)
+            if stored is not None and loader.source is not None and not self.revalidate:
+                # a remote stat per thumbnail would hold up the whole page:
+                # the stored one is shown now and checked later
+                loader._generated.emit(self.filename, QImage.fromData(stored[1]))
+                loader.pool.start(_ThumbnailJob(loader, self.filename, revalidate=True),
+                                  REVALIDATE_PRIORITY)
+                return
+            mtime_ns = loader.mtime(self.filename)
+            if stored is not None and stored[0] == mtime_ns:
+                if self.revalidate:
+                    return
+                image = QImage.fromData(stored[1])
+            else:
+                local_path = (
+                    loader.source.fetch(self.filename) if loader.source is not None
+                    else self.filename
+                )
+                image = decode_image(local_path, (loader.size, loader.size))
+                if not image.isNull():
+                    loader.store.put(self.filename, mtime_ns, loader.size, encode_thumbnail(image))
+        except Exception:
+            if self.revalidate:
+                # keep showing the stored thumbnail
+                return
+            image = QImage()
+        loader._generated.emit(self.filename, image)
+
+
+class ThumbnailLoader(QObject):
+    """Generates thumbnails on a worker pool, newest request first.
+
+    Thumbnails come from ``store`` when possible; the most recently used
+    ones are also kept in memory. ``prune`` cancels the queued jobs of
+    thumbnails that scrolled out of view.
+    """
+
+    thumbnailReady = pyqtSignal(str, QImage)
+    _generated = pyqtSignal(str, QImage)
+
+    def __init__(self, store: ThumbnailStore, source=None, size=THUMBNAIL_SIZE,
+                 memory_items=1024, max_workers=0, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.source = source
+        self.size = size
+        self.memory_items = memory_items
+        self.pool = QThreadPool(self)
+        if max_workers > 0:
+            self.pool.setMaxThreadCount(max_workers)
+
+        self._images = OrderedDict()
+        self._jobs = {}
+        self._priority = 0
+        self._generated.connect(self._onGenerated)
+
+    def mtime(self, filename: str) -> int:
+        if self.source is not None:
+            return self.source.mtime(filename)
+        return os.stat(filename).st_mtime_ns
+
+    def thumbnail(self, filename: str):
+        image = self._images.get(filename)
+        if image is not None:
+            self._images.move_to_end(filename)
+            return image
+        if filename not in self._jobs:
+            # rows scrolled into view last are generated first
+            job = _ThumbnailJob(self, filename)
+            self._jobs[filename] = job
+            self._priority += 1
+            self.pool.start(job, self._priority)
+        return None
+
+    def prune(self, keep) -> list:
+        """Cancel the queued jobs of filenames not in ``keep``; returns
+        their filenames."""
+        pruned = [
+            filename for filename, job in self._jobs.items()
+            if filename not in keep and not job.started and self.pool.tryTake(job)
+        ]
+        for filename in pruned:
+            del self._jobs[filename]
+        return pruned
+
+    def _onGenerated(self, filename: str, image: QImage):
+        self._jobs.pop(filename, None)
+        self._images[filename] = image
+        while len(self._images) > self.memory_items:
+            self._images.popitem(last=False)
+        self.thumbnailReady.emit(filename, image)
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+        self.store.close()
+
+
+class ThumbnailProxyModel(QIdentityProxyModel):
+    """Adds thumbnails (DecorationRole) and short captions to the list
+    model for the grid view."""
+
+    def __init__(self, loader: ThumbnailLoader, path_for_row, tag_column: int, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.path_for_row = path_for_row
+        self.tag_column = tag_column
+        self._waiting = {}
+        loader.thumbnailReady.connect(self._onThumbnailReady)
+        self.modelReset.connect(self._waiting.clear)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.column() != 0:
+            return super().data(index, role)
+        if role == Qt.DecorationRole:
+            filename = self.path_for_row(index.row())
+            image = self.loader.thumbnail(filename)
+            if image is None:
+                self._waiting.setdefault(filename, set()).add(index.row())
+            return image
+        if role == Qt.DisplayRole:
+            tag = super().data(self.index(index.row(), self.tag_column), role)
+            name = os.path.basename(self.path_for_row(index.row()))
+            return f"{name}\n{tag}" if tag else name
+        if role == Qt.ToolTipRole:
+            return super().data(index, Qt.DisplayRole)
+        return super().data(index, role)
+
+    def prune(self, first: int, last: int):
+        """Drop thumbnail jobs outside rows ``first``..``last``."""
+        keep = {self.path_for_row(row) for row in range(first, last + 1)}
+        for filename in self.loader.prune(keep):
+            self._waiting.pop(filename, None)
+
+    def _onThumbnailReady(self, filename: str, image: QImage):
+        for row in self._waiting.pop(filename, ()):
+            if row < self.rowCount():
+                index = self.index(row, 0)
+                self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    """Draws the thumbnail above its caption."""
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        option.decorationPosition = QStyleOptionViewItem.Top
+        option.displayAlignment = Qt.AlignHCenter | Qt.AlignTop
@@ -1,51 +1,119 @@
 #!/usr/bin/env python3
 
+import sys
+
+if __name__ == "__main__" and "--startup-timing" in sys.argv:
+    # installed before the imports below so that they are measured too
+    from startup_timing import StartupTiming
+    startup_timing = StartupTiming().install()
+else:
+    startup_timing = None
+
 import os
+import math
+import sqlite3
+import threading
+import time
 from pathlib import PurePath, Path
 from glob import glob
 
-import paramiko
-import cv2
 import numpy as np
-import pandas as pd
 
 from PyQt5 import QtCore
-from PyQt5.QtCore import Qt, QSize, QModelIndex
+from PyQt5.QtCore import Qt, QSize, QModelIndex, pyqtSignal
 from PyQt5.QtGui import (
-    QImage, QPixmap, QPalette, QPainter, QFont, QKeySequence
+    QImage, QPixmap, QPalette, QPainter, QFont, QKeySequence, QDoubleValidator
 )
-from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
 from PyQt5.QtWidgets import (
     QLabel, QSizePolicy, QScrollArea, QMessageBox, QMainWindow, QMenu, QAction,
     qApp, QFileDialog,
     QPushButton, QVBoxLayout, QHBoxLayout, QWidget,
     QComboBox, QRadioButton, QButtonGroup,
-    QListWidget, QListWidgetItem, QAbstractItemView,
-    QLineEdit,
+    QTableView, QHeaderView, QAbstractItemView,
+    QLineEdit, QListView, QTabWidget, QStackedWidget,
 )
 
-ssh = paramiko.SSHClient()
+from compare_view import CompareView
+from image_cache import ImageCache
+from image_loader import ImageLoader, native_size
+from label_data import (
+    LabelList, FILENAME_COL, PRED_COL, TAG_COL, SCORE_COL, ORIGIN_COLS, TAGGED_COLS,
+    MAIN_TAG_TRUE, MAIN_TAG_FALSE, make_tag,
+)
+from line_index import StreamingList
+from metadata_index import (
+    MetadataFilter, ANY, UNTAGGED, TAGGED, SORT_FILE, SORT_SCORE_ASC, SORT_SCORE_DESC,
+)
+from metadata_model import MetadataTableModel
+from metrics import SessionMetrics
+from priority import PriorityOrder
+from work_queue import WorkQueue
+from thumbnails import (
+    ThumbnailStore, ThumbnailLoader, ThumbnailProxyModel, ThumbnailDelegate, THUMBNAIL_SIZE,
+)
 
 class QImageViewer(QMainWindow):
-    def __init__(self):
+    duplicatesFound = pyqtSignal(str, object)
+
+    def __init__(self, cache_budget_mb: int = 512, image_source=None, thumbnail_cache=None,
+                 metrics=None, stream_above_mb: int = 2048):
         super().__init__()
 
-        self.printer = QPrinter()
+        # latencies of open/populate/show/decode/tag/export and labels per
+        # minute (see metrics), shown by View > Session Stats
+        self.metrics = metrics or SessionMetrics()
+        self.statsDialog = None
+        self.show_started = None
+
+        # print support is only loaded once something is printed
+        self.printer = None
         self.scaleFactor = 0.0
         self.setFont(QFont("Consolas"))
 
-        self.filename_col = "filename"
-        self.pred_col = "pred."
-        self.tag_col = "tag"
-        self.conf_score_col = "conf. score"
-        self.origin_cols = [self.filename_col, self.pred_col, self.conf_score_col]
-        self.tagged_cols = ["filename", self.pred_col, self.tag_col, self.conf_score_col]
+        self.filename_col = FILENAME_COL
+        self.pred_col = PRED_COL
+        self.tag_col = TAG_COL
+        self.conf_score_col = SCORE_COL
+        self.origin_cols = ORIGIN_COLS
+        self.tagged_cols = TAGGED_COLS
         self.pred_col_fixed = f"{self.pred_col:<7}"        
         self.tag_col_fixed = f"{self.tag_col:<7}"
         self.conf_score_col_fixed = f"{self.conf_score_col:<7}"
 
-        self.main_tag_true = "맞"
-        self.main_tag_false = "틀"
+        self.main_tag_true = MAIN_TAG_TRUE
+        self.main_tag_false = MAIN_TAG_FALSE
+
+        # the open list (see label_data); its journal is fsynced periodically.
+        # Lists above stream_above_mb are streamed from disk (see line_index):
+        # no filters, priority order, work queue or near-duplicates then
+        self.labels = None
+        self.streaming = False
+        self.stream_above = stream_above_mb * 2**20
+        self.journalSyncTimer = QtCore.QTimer(self)
+        self.journalSyncTimer.setInterval(1000)
+        self.journalSyncTimer.timeout.connect(self.syncJournal)
+
+        # several labelers can share one list through a work queue: Next
+        # then walks the rows of a leased block instead of the table
+        self.workQueue = None
+        self.queueBlock = None
+        self.queueSkipped = set()
+        self.queue_version = 0
+        self.queueTimer = QtCore.QTimer(self)
+        self.queueTimer.setInterval(30 * 1000)
+        self.queueTimer.timeout.connect(self.syncWorkQueue)
+
+        # priority order (see priority): Next hands out the untagged rows
+        # the model is least sure about; Previous walks back the rows shown
+        self.priorityOrder = None
+        self.priorityHistory = []
+
+        # near-duplicate groups of the open list (see dedup), found in the
+        # background; tags can be applied to a whole group at once
+        self.image_source = image_source
+        self.duplicateGroups = None
+        self.duplicatesThread = None
+        self.duplicatesFound.connect(self.onDuplicatesFound)
 
         # self.sub_tag_none = ""
         # self.sub_tag_dict
@@ -53,6 +121,18 @@ class QImageViewer(QMainWindow):
         # self.sub_tag_diff = "diff"
         # self
 
+        # images of the next/previous rows are decoded ahead of the cursor
+        self.prefetch_radius = 3
+        self.current_image_filename = None
+        self.current_target = None
+        self.displayed_filename = None
+        self.imageSize = QSize()
+        self.imageCache = ImageCache(cache_budget_mb * 2**20)
+        self.imageLoader = ImageLoader(
+            self.imageCache, image_source, parent=self, metrics=self.metrics
+        )
+        self.imageLoader.imageReady.connect(self.onImageReady)
+
         self.imageLabel = QLabel()
 
         # self.imageLabel.setBaseSize(500, 500)
@@ -66,6 +146,15 @@ class QImageViewer(QMainWindow):
         self.leftImageView.setWidget(self.imageLabel)
         # self.leftImageView.setVisible(False)
         self.leftImageView.setVisible(True)
+
+        # View > Compare: the row's image next to the images of its compare
+        # columns (see label_data.COMPARE_COLS), with one zoom/pan for all
+        self.compareView = CompareView()
+        self.compareView.targetChanged.connect(self.compareTargetChanged)
+        self.compare_paths = []
+        self.imageStack = QStackedWidget()
+        self.imageStack.addWidget(self.leftImageView)
+        self.imageStack.addWidget(self.compareView)
         
         # self.set_default_image_view()
 
@@ -149,11 +238,100 @@ class QImageViewer(QMainWindow):
         
         self.rightSidebarLayout = QHBoxLayout(self.central)
 
-        self.listWidget = QListWidget()
-        self.listWidget.setSelectionMode(QAbstractItemView.ExtendedSelection)
-        self.get_image_list([])
-
-        self.leftSidebarLayout.addWidget(self.listWidget)
+        # rows are rendered lazily from self.labels; row heights are fixed
+        # so the view never measures all rows
+        self.listModel = MetadataTableModel(self.filename_col, parent=self)
+        self.listView = QTableView()
+        self.listView.setModel(self.listModel)
+        self.listView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.listView.setWordWrap(False)
+        self.listView.verticalHeader().setVisible(False)
+        self.listView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.listView.verticalHeader().setDefaultSectionSize(
+            self.listView.fontMetrics().height() + 4
+        )
+        self.listView.horizontalHeader().setStretchLastSection(True)
+        self.get_image_list(None)
+
+        # the grid shows the same rows as the table; thumbnails are generated
+        # on a worker pool and kept in an on-disk cache across sessions
+        if thumbnail_cache is None:
+            thumbnail_cache = os.path.expanduser("~/.cache/img_labeler/thumbnails.sqlite")
+        self.thumbnailLoader = ThumbnailLoader(
+            ThumbnailStore(thumbnail_cache), image_source, parent=self
+        )
+        self.gridModel = ThumbnailProxyModel(
+            self.thumbnailLoader, self.image_path, self.tagged_cols.index(self.tag_col),
+            parent=self,
+        )
+        self.gridModel.setSourceModel(self.listModel)
+        self.gridView = QListView()
+        self.gridView.setModel(self.gridModel)
+        self.gridView.setItemDelegate(ThumbnailDelegate(self.gridView))
+        self.gridView.setFlow(QListView.LeftToRight)
+        self.gridView.setWrapping(True)
+        self.gridView.setResizeMode(QListView.Adjust)
+        self.gridView.setMovement(QListView.Static)
+        self.gridView.setUniformItemSizes(True)
+        # items are laid out in batches so long lists do not block the UI
+        self.gridView.setLayoutMode(QListView.Batched)
+        self.gridView.setBatchSize(5000)
+        self.gridView.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.gridView.setGridSize(QSize(THUMBNAIL_SIZE + 20, THUMBNAIL_SIZE + 44))
+        self.gridView.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.gridView.clicked.connect(self.gridOnClicked)
+        self.gridView.activated.connect(self.gridOnActivated)
+        # once scrolling settles, thumbnails queued for rows that went out
+        # of view are dropped
+        self.gridPruneTimer = QtCore.QTimer(self)
+        self.gridPruneTimer.setSingleShot(True)
+        self.gridPruneTimer.setInterval(100)
+        self.gridPruneTimer.timeout.connect(self.pruneThumbnails)
+        # (the signals' arguments must not reach QTimer.start(msec))
+        self.gridView.verticalScrollBar().valueChanged.connect(
+            lambda _: self.gridPruneTimer.start())
+        self.gridView.verticalScrollBar().rangeChanged.connect(
+            lambda *_: self.gridPruneTimer.start())
+
+        self.centerTabs = QTabWidget()
+        self.centerTabs.addTab(self.imageStack, "Image")
+        self.centerTabs.addTab(self.gridView, "Grid")
+
+        # predicates run vectorized over self.metadata (see metadata_index)
+        self.metadataFilter = None
+        self.filterPredComboBox = QComboBox()
+        self.filterPredComboBox.addItem(ANY, ANY)
+        self.filterPredComboBox.activated.connect(self.applyFilter)
+        self.filterTagComboBox = QComboBox()
+        for item in (ANY, UNTAGGED, TAGGED, self.main_tag_true, self.main_tag_false):
+            self.filterTagComboBox.addItem(item)
+        self.filterTagComboBox.activated.connect(self.applyFilter)
+        self.filterMinScoreEdit = QLineEdit()
+        self.filterMinScoreEdit.setPlaceholderText("min score")
+        self.filterMinScoreEdit.setValidator(QDoubleValidator())
+        self.filterMinScoreEdit.editingFinished.connect(self.applyFilter)
+        self.filterMaxScoreEdit = QLineEdit()
+        self.filterMaxScoreEdit.setPlaceholderText("max score")
+        self.filterMaxScoreEdit.setValidator(QDoubleValidator())
+        self.filterMaxScoreEdit.editingFinished.connect(self.applyFilter)
+        self.sortComboBox = QComboBox()
+        for item in (SORT_FILE, SORT_SCORE_ASC, SORT_SCORE_DESC):
+            self.sortComboBox.addItem(item)
+        self.sortComboBox.activated.connect(self.applyFilter)
+        self.filterCountLabel = QLabel()
+
+        self.filterLayout = QHBoxLayout()
+        self.filterLayout.addWidget(self.filterPredComboBox)
+        self.filterLayout.addWidget(self.filterTagComboBox)
+        self.filterLayout.addWidget(self.filterMinScoreEdit)
+        self.filterLayout.addWidget(self.filterMaxScoreEdit)
+        self.filterLayout.addWidget(self.sortComboBox)
+        self.filterLayout.addWidget(self.filterCountLabel)
+
+        self.listLayout = QVBoxLayout()
+        self.listLayout.addLayout(self.filterLayout)
+        self.listLayout.addWidget(self.listView)
+        self.leftSidebarLayout.addLayout(self.listLayout)
 
         self.centralLayout.addLayout(self.leftSidebarLayout)
         self.centralLayout.addLayout(self.centerBoxLayout)
@@ -161,21 +339,27 @@ class QImageViewer(QMainWindow):
 
         self.centerArrows.addWidget(self.showPreviousButton)
         self.centerArrows.addWidget(self.showNextButton)
-        self.centerBoxLayout.addWidget(self.leftImageView)
+        self.centerBoxLayout.addWidget(self.centerTabs)
         self.centerBoxLayout.addLayout(self.centerArrows)
         self.centerBoxLayout.addLayout(self.centerDetails)
 
         self.img_select_layout = QHBoxLayout(QWidget())
         
+        self.tagSelectedButton = QPushButton("Tag selected")
+        self.tagSelectedButton.clicked.connect(self.tagSelected)
+        self.mainTagLayout.addWidget(self.tagSelectedButton)
+
         self.rightSidebarLayout.addLayout(self.tagLayout)
         self.setCentralWidget(self.central)
 
         self.createActions()
         self.createMenus()
 
-        # self.listWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.listWidget.setSelectionMode(QAbstractItemView.SingleSelection)
-        self.listWidget.itemSelectionChanged.connect(self.listOnSelection)
+        self.cacheStatusLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.cacheStatusLabel)
+
+        self.listView.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.listView.selectionModel().selectionChanged.connect(self.listOnSelection)
         self.listOnSelection()
 
         self.setWindowTitle("Image Viewer")
@@ -224,85 +408,442 @@ class QImageViewer(QMainWindow):
         return QImage(bg_image.data, w, h, QImage.Format_BGR888)
 
     def set_default_image_view(self):
+        self.current_image_filename = None
+        self.displayed_filename = None
+        self.compare_paths = []
+        self.compareView.clear()
         self.imageLabel.setPixmap(
             QPixmap.fromImage(self.get_image_view_background())
         )
         self.scaleFactor = 1.0
 
         self.leftImageView.setVisible(True)
-        self.printAct.setEnabled(True)
+        # only the background is shown: nothing to print
+        self.printAct.setEnabled(False)
         self.fitToWindowAct.setEnabled(True)
         self.updateActions()
 
         self.imageLabel.adjustSize()
     
-    def get_image_list(self, img_list):
-        self.listWidget.clear()
-        for i in img_list:
-            item = QListWidgetItem()
-            item.setText(i)
-            self.listWidget.addItem(item)
-
-    def get_idx_from_list(self, row: QListWidgetItem) -> int:
-        idx = self.listWidget.indexFromItem(row)
-        return idx.row()
+    def get_image_list(self, labels):
+        self.listModel.setList(labels, self.tagged_cols)
+        if labels is not None:
+            self.listView.setColumnWidth(0, 320)
+
+    def hasSelection(self) -> bool:
+        return self.listView.selectionModel().hasSelection()
+
+    def currentRow(self) -> int:
+        rows = self.listView.selectionModel().selectedRows()
+        return rows[0].row() if rows else -1
+
+    def setCurrentRow(self, row: int):
+        self.listView.selectRow(row)
+        self.listView.scrollTo(self.listModel.index(row, 0))
+
+
+    def resetFilter(self):
+        for widget in self.filterWidgets():
+            widget.setEnabled(not self.streaming)
+        if self.streaming:
+            # every predicate would need a pass over the whole file
+            self.metadataFilter = None
+            self.filterCountLabel.setText(f"{len(self.labels)} / {len(self.labels)}")
+            return
+        self.metadataFilter = MetadataFilter(
+            self.metadata, self.pred_col, self.tag_col, self.conf_score_col
+        )
+        self.filterPredComboBox.clear()
+        self.filterPredComboBox.addItem(ANY, ANY)
+        for pred in sorted(self.metadataFilter.pred.values, key=str):
+            self.filterPredComboBox.addItem(str(pred), pred)
+        self.filterTagComboBox.setCurrentIndex(0)
+        self.filterMinScoreEdit.setText("")
+        self.filterMaxScoreEdit.setText("")
+        self.sortComboBox.setCurrentIndex(0)
+        self.filterCountLabel.setText(f"{len(self.metadata)} / {len(self.metadata)}")
 
+    @staticmethod
+    def scoreBound(lineEdit: QLineEdit):
+        try:
+            return float(lineEdit.text())
+        except ValueError:
+            return None
+
+    def applyFilter(self):
+        if self.metadataFilter is None:
+            return
+        with self.metrics.timer("filter"):
+            rows = self.metadataFilter.rows(
+                pred=self.filterPredComboBox.currentData(),
+                tag=self.filterTagComboBox.currentText(),
+                min_score=self.scoreBound(self.filterMinScoreEdit),
+                max_score=self.scoreBound(self.filterMaxScoreEdit),
+                sort=self.sortComboBox.currentText(),
+            )
+            current = self.img_idx if self.hasSelection() else None
+            self.listModel.setRows(rows)
+        self.filterCountLabel.setText(f"{self.listModel.rowCount()} / {len(self.metadata)}")
+        if current is not None and self.listModel.viewRow(current) >= 0:
+            self.setCurrentRow(self.listModel.viewRow(current))
 
     def listOnSelection(self):
-        if self.listWidget.selectedItems():
-            self.selected: QListWidgetItem = self.listWidget.selectedItems()[0]
-            self.showImage(Path(self.selected.text()).as_posix())
+        if self.hasSelection():
+            self.view_row = self.currentRow()
+            self.img_idx = self.listModel.position(self.view_row)
 
-            self.img_idx = self.get_idx_from_list(self.selected)
+            self.showImage(self.image_path(self.view_row))
 
-            self.predText.setText(f"{self.metadata.loc[self.img_idx, self.pred_col]}")
-            self.tagText.setText(f"{self.metadata.loc[self.img_idx, self.tag_col]}")
-            self.descText.setText(f"{self.metadata.loc[self.img_idx, self.conf_score_col]}")
+            row = self.labels.row(self.img_idx)
+            self.predText.setText(f"{row[self.pred_col]}")
+            self.tagText.setText(f"{row[self.tag_col] or ''}")
+            # str, not format: a float32 score would show its float64 digits
+            self.descText.setText(str(row[self.conf_score_col]))
 
         else:
             self.set_default_image_view()
             self.tagText.setText("")
             self.descText.setText("")
 
+    def gridOnClicked(self, index):
+        self.setCurrentRow(index.row())
+
+    def gridOnActivated(self, index):
+        self.setCurrentRow(index.row())
+        self.centerTabs.setCurrentWidget(self.imageStack)
+
+    def pruneThumbnails(self):
+        viewport = self.gridView.viewport().rect()
+        first = self.gridView.indexAt(viewport.topLeft())
+        if not first.isValid():
+            return
+        last = self.gridView.indexAt(viewport.bottomRight())
+        # a partly filled last line
+        last_row = last.row() if last.isValid() else self.gridModel.rowCount() - 1
+        self.gridModel.prune(first.row(), last_row)
+
     def showPrevious(self):
-        if self.listWidget.count() > 0:
-            if self.listWidget.selectedItems():
-                self.img_idx = self.get_idx_from_list(self.selected)
-                if self.img_idx > 0:
-                    self.listWidget.setCurrentRow(self.img_idx - 1)
+        if self.priorityOrder is not None and self.workQueue is None:
+            self.showPreviousPriority()
+            return
+        if self.listModel.rowCount() > 0:
+            if self.hasSelection():
+                row = self.currentRow()
+                if row > 0:
+                    self.setCurrentRow(row - 1)
             else:
-                self.img_idx = 0
-                self.listWidget.setCurrentRow(self.img_idx)
+                self.setCurrentRow(0)
 
     def showNext(self):
-        if self.listWidget.count() > 0:
-            if self.listWidget.selectedItems():
-                self.img_idx = self.get_idx_from_list(self.selected)
-                if self.img_idx < self.listWidget.count() - 1:
-                    self.listWidget.setCurrentRow(self.img_idx + 1)
+        if self.workQueue is not None:
+            self.showNextQueued()
+            return
+        if self.priorityOrder is not None:
+            self.showNextPriority()
+            return
+        if self.listModel.rowCount() > 0:
+            if self.hasSelection():
+                row = self.currentRow()
+                if row < self.listModel.rowCount() - 1:
+                    self.setCurrentRow(row + 1)
             else:
-                self.img_idx = 0
-                self.listWidget.setCurrentRow(self.img_idx)
+                self.setCurrentRow(0)
+
+
+    def startPriorityOrder(self):
+        self.priorityOrder = PriorityOrder(
+            self.metadata, self.pred_col, self.tag_col, self.conf_score_col
+        )
+        self.priorityHistory = []
+        # like the work queue, the order is over all rows
+        self.resetFilter()
+        self.applyFilter()
+        for widget in self.filterWidgets():
+            widget.setEnabled(False)
+        self.showNextPriority()
+
+    def stopPriorityOrder(self):
+        if self.priorityOrder is not None:
+            self.priorityOrder = None
+            self.priorityHistory = []
+            if self.workQueue is None:
+                for widget in self.filterWidgets():
+                    widget.setEnabled(True)
+
+    def togglePriorityOrder(self, checked):
+        if checked and self.labels is not None:
+            self.startPriorityOrder()
+        else:
+            self.stopPriorityOrder()
 
+    def showNextPriority(self):
+        history = self.priorityHistory
+        if self.hasSelection() and self.img_idx in history[:-1]:
+            # back in the history: step forward through it first
+            position = history[history.index(self.img_idx) + 1]
+        else:
+            position = self.priorityOrder.next()
+            if position is None:
+                self.statusBar().showMessage("priority order: every row is tagged", 5000)
+                return
+            history.append(position)
+        self.setCurrentRow(self.listModel.viewRow(position))
+
+    def showPreviousPriority(self):
+        history = self.priorityHistory
+        if self.hasSelection() and self.img_idx in history:
+            i = history.index(self.img_idx)
+            if i > 0:
+                self.setCurrentRow(self.listModel.viewRow(history[i - 1]))
+
+    def joinWorkQueue(self):
+        try:
+            workQueue = WorkQueue(self.filename, len(self.metadata))
+        except (ValueError, sqlite3.Error) as e:
+            # e.g. a queue made before rows were added to the list
+            QMessageBox.warning(self, "Work Queue", f"Cannot share the list: {e}")
+            self.queueAct.setChecked(False)
+            return
+        # the queue decides which rows we get
+        self.priorityAct.setChecked(False)
+        self.priorityAct.setEnabled(False)
+        self.stopPriorityOrder()
+        self.workQueue = workQueue
+        self.queueBlock = None
+        self.queueSkipped = set()
+        self.queue_version = 0
+        self.pullQueueTags()
+        # rows come in queue order, which a filtered/sorted table would hide
+        self.resetFilter()
+        self.applyFilter()
+        for widget in self.filterWidgets():
+            widget.setEnabled(False)
+        self.queueTimer.start()
+        self.showNextQueued()
+
+    def leaveWorkQueue(self):
+        if self.workQueue is not None:
+            self.queueTimer.stop()
+            self.workQueue.close()
+            self.workQueue = None
+            self.queueBlock = None
+            for widget in self.filterWidgets():
+                widget.setEnabled(True)
+            self.priorityAct.setEnabled(self.labels is not None)
+
+    def toggleWorkQueue(self, checked):
+        if checked and self.labels is not None:
+            self.joinWorkQueue()
+        else:
+            self.leaveWorkQueue()
+
+    def filterWidgets(self):
+        return (
+            self.filterPredComboBox, self.filterTagComboBox, self.filterMinScoreEdit,
+            self.filterMaxScoreEdit, self.sortComboBox,
+        )
+
+    def pullQueueTags(self):
+        """Apply the tags other labelers recorded since the last pull."""
+        changes = self.workQueue.changes(self.queue_version)
+        if not changes:
+            return
+        self.queue_version = changes[-1][4]
+        # compared row by row; the column is not converted as a whole
+        filenames = self.metadata[self.filename_col].array
+        by_tag = {}
+        for row, filename, tag, writer, _ in changes:
+            if (writer != self.workQueue.owner
+                    and row < len(filenames) and filenames[row] == filename):
+                by_tag.setdefault(tag, []).append(row)
+        for tag, positions in by_tag.items():
+            # already persisted in the queue, our journal does not need them
+            positions = self.labels.tag_rows(positions, tag, journal=False)
+            self.listModel.rowsChanged(positions)
+            self.metadataFilter.setTag(positions, tag)
+            if self.priorityOrder is not None:
+                self.priorityOrder.tagged(positions, tag)
+
+    def syncWorkQueue(self):
+        if self.workQueue is None:
+            return
+        self.workQueue.renew()
+        self.pullQueueTags()
+        done, leased, blocks = self.workQueue.progress()
+        self.statusBar().showMessage(
+            f"work queue: {done or 0}/{blocks} blocks done, {leased or 0} leased", 5000
+        )
+
+    def nextQueuedRow(self):
+        self.pullQueueTags()
+        tags = self.metadata[self.tag_col]
+        while True:
+            if self.queueBlock is None:
+                self.queueBlock = self.workQueue.claim()
+                if self.queueBlock is None:
+                    return None
+            rows = self.workQueue.block_rows(self.queueBlock)
+            block_tags = tags.iloc[rows.start:rows.stop]
+            untagged = rows.start + np.flatnonzero(
+                (block_tags.isna() | (block_tags == "")).to_numpy()
+            )
+            if len(untagged) == 0:
+                self.workQueue.finish(self.queueBlock)
+            else:
+                # rows passed over without a tag stay leased to us until we
+                # leave the queue
+                for position in untagged:
+                    if position not in self.queueSkipped:
+                        return int(position)
+            self.queueBlock = None
+
+    def showNextQueued(self):
+        if self.hasSelection() and self.isUntagged(self.img_idx):
+            self.queueSkipped.add(self.img_idx)
+        position = self.nextQueuedRow()
+        if position is None:
+            self.statusBar().showMessage("work queue: no unclaimed rows left", 5000)
+            return
+        self.setCurrentRow(self.listModel.viewRow(position))
+
+    def isUntagged(self, position: int) -> bool:
+        return not self.labels.row(position)[self.tag_col]
+
+    def image_path(self, view_row: int) -> str:
+        return Path(self.listModel.filename(view_row)).as_posix()
+
+    def prefetchWindow(self, view_row: int):
+        count = self.listModel.rowCount()
+        window = []
+        for offset in range(1, self.prefetch_radius + 1):
+            for row in (view_row + offset, view_row - offset):
+                if 0 <= row < count:
+                    window.append(self.image_path(row))
+                    if self.isComparing():
+                        window.extend(
+                            p for p in self.comparePaths(self.listModel.position(row)) if p
+                        )
+        return window
+
+    def viewportTarget(self):
+        # rounded up so that small window resizes reuse cached images
+        step = 128
+        size = self.leftImageView.viewport().size()
+        return (-(-size.width() // step) * step, -(-size.height() // step) * step)
+
+    def displayTarget(self):
+        # images are decoded at the displayed size; full resolution is only
+        # needed once zoomed past 100%
+        if self.fitToWindowAct.isChecked():
+            return self.viewportTarget()
+        if self.scaleFactor >= 1.0:
+            return None
+        return (
+            math.ceil(self.imageSize.width() * self.scaleFactor),
+            math.ceil(self.imageSize.height() * self.scaleFactor),
+        )
 
     def showImage(self, img_filename):
-        image = QImage(img_filename)
+        self.current_image_filename = img_filename
+        # until the image is on screen, whether decoded or cached
+        self.show_started = (img_filename, time.perf_counter())
+        if self.isComparing():
+            compared = self.comparePaths(self.img_idx)
+            self.compare_paths = [img_filename] + compared
+            self.compareView.setFilenames(self.compare_paths, [
+                f"{col}: {os.path.basename(path)}" if path else col
+                for col, path in zip([self.filename_col] + self.labels.compare_cols,
+                                     self.compare_paths)
+            ])
+            self.requestImage(self.compareView.decodeTarget())
+        else:
+            self.requestImage(self.viewportTarget())
+
+    def requestImage(self, target):
+        if self.current_image_filename is None:
+            return
+        self.current_target = target
+        companions, window_target = (), self.viewportTarget()
+        if self.isComparing():
+            companions = [p for p in self.compare_paths[1:] if p]
+            window_target = self.compareView.fitTarget()
+        image = self.imageLoader.request(
+            self.current_image_filename, target,
+            self.prefetchWindow(self.view_row), window_target, companions=companions,
+        )
+        if image is not None:
+            self.displayImage(self.current_image_filename, image)
+
+    def onImageReady(self, img_filename, target, image):
+        if target != self.current_target:
+            return
+        if img_filename == self.current_image_filename or (
+                self.isComparing() and img_filename in self.compare_paths):
+            self.displayImage(img_filename, image)
+
+    def isComparing(self) -> bool:
+        return (self.compareAct.isChecked() and self.labels is not None
+                and bool(self.labels.compare_cols))
+
+    def comparePaths(self, position: int):
+        """Paths in the compare columns of a row, None where empty."""
+        return [
+            Path(path).as_posix() if path else None
+            for path in (self.labels.value(position, col) for col in self.labels.compare_cols)
+        ]
+
+    def toggleCompare(self, checked):
+        comparing = self.isComparing()
+        self.imageStack.setCurrentWidget(self.compareView if comparing else self.leftImageView)
+        self.compareView.reset()
+        if not comparing:
+            self.compare_paths = []
+            self.leftImageView.setWidgetResizable(self.fitToWindowAct.isChecked())
+        self.updateActions()
+        if self.current_image_filename is not None:
+            self.showImage(self.current_image_filename)
+
+    def compareTargetChanged(self):
+        # zoomed past the resolution the panes were decoded at
+        if self.isComparing() and self.current_image_filename is not None:
+            self.requestImage(self.compareView.decodeTarget())
+
+    def displayImage(self, img_filename, image: QImage):
+        if self.show_started is not None and self.show_started[0] == img_filename:
+            self.metrics.record(
+                "show", time.perf_counter() - self.show_started[1], img_filename
+            )
+            self.show_started = None
+        if self.isComparing():
+            # unreadable images are reported in their pane
+            self.compareView.setImage(img_filename, image)
+            self.cacheStatusLabel.setText(self.imageCache.summary())
+            return
         if image.isNull():
             QMessageBox.information(self, "Image Viewer", "Cannot load %s." % img_filename)
             return
 
+        if img_filename != self.displayed_filename:
+            # a new image starts fitted to the viewport, at most at 100%
+            self.displayed_filename = img_filename
+            self.imageSize = native_size(image)
+            viewport = self.leftImageView.viewport().size()
+            self.scaleFactor = min(
+                1.0,
+                viewport.width() / self.imageSize.width(),
+                viewport.height() / self.imageSize.height(),
+            )
+
         self.imageLabel.setPixmap(QPixmap.fromImage(image))
-        self.scaleFactor = 1.0
+        self.cacheStatusLabel.setText(self.imageCache.summary())
 
         self.leftImageView.setVisible(True)
         self.printAct.setEnabled(True)
         self.fitToWindowAct.setEnabled(True)
         self.updateActions()
 
-        # self.imageLabel.setFixedSize(QSize(400, 400))
-        self.imageLabel.adjustSize()
         if not self.fitToWindowAct.isChecked():
-            self.imageLabel.adjustSize()
+            self.imageLabel.resize(self.scaleFactor * self.imageSize)
 
 
     def getSubTag(self):
@@ -314,29 +855,128 @@ class QImageViewer(QMainWindow):
         return subTag
 
 
+    def saveTag(self, new_tag: str):
+        self.saveTags([self.img_idx], new_tag)
+
+    def saveTags(self, positions, new_tag: str):
+        if self.propagateDuplicatesAct.isChecked() and self.duplicateGroups is not None:
+            groups = self.duplicateGroups
+            positions = np.flatnonzero(np.isin(groups, groups[np.asarray(positions)]))
+        with self.metrics.timer("tag"):
+            positions = self.labels.tag_rows(positions, new_tag)
+            self.listModel.rowsChanged(positions)
+            if self.metadataFilter is not None:
+                self.metadataFilter.setTag(positions, new_tag)
+            if self.priorityOrder is not None:
+                self.priorityOrder.tagged(positions, new_tag)
+            if self.workQueue is not None:
+                self.workQueue.record(
+                    positions, self.metadata[self.filename_col].iloc[positions].to_numpy(), new_tag
+                )
+        self.metrics.labeled(len(positions))
+
+    def findDuplicates(self):
+        if self.labels is None or (self.duplicatesThread is not None
+                                   and self.duplicatesThread.is_alive()):
+            return
+        import multiprocessing
+        import dedup
+
+        filename = self.filename
+        paths = self.metadata[self.filename_col].tolist()
+
+        def run():
+            try:
+                # forking a process that runs Qt threads is not safe
+                groups = dedup.find_duplicates(
+                    paths, mp_context=multiprocessing.get_context("spawn")
+                )
+            except Exception as e:
+                groups = e
+            self.duplicatesFound.emit(filename, groups)
+
+        self.findDuplicatesAct.setEnabled(False)
+        self.statusBar().showMessage(f"Hashing {len(paths)} images...")
+        self.duplicatesThread = threading.Thread(target=run, name="dedup", daemon=True)
+        self.duplicatesThread.start()
+
+    def onDuplicatesFound(self, filename, groups):
+        self.findDuplicatesAct.setEnabled(self.labels is not None and self.image_source is None)
+        if isinstance(groups, Exception):
+            self.statusBar().showMessage(f"Finding near-duplicates failed: {groups}", 10000)
+            return
+        if self.labels is None or filename != self.filename or len(groups) != len(self.metadata):
+            # another list was opened meanwhile
+            return
+        self.duplicateGroups = groups
+        duplicates = len(groups) - int((groups == np.arange(len(groups))).sum())
+        self.propagateDuplicatesAct.setEnabled(True)
+        self.statusBar().showMessage(
+            f"{duplicates} near-duplicates in {len(groups)} images", 10000
+        )
+
+    def syncJournal(self):
+        if self.labels is not None:
+            with self.metrics.timer("journal sync"):
+                self.labels.sync()
+
+    def exportList(self):
+        if self.labels is not None:
+            if self.workQueue is not None:
+                # the list is shared; write everyone's tags, not just ours
+                self.pullQueueTags()
+            with self.metrics.timer("export", self.filename):
+                self.labels.export()
+
+    def closeJournal(self):
+        if self.labels is not None:
+            if self.workQueue is not None:
+                self.pullQueueTags()
+            self.journalSyncTimer.stop()
+            if self.streaming:
+                # the table reads rows from the file that is being closed
+                self.get_image_list(None)
+            self.labels.close()
+            self.labels = None
+            self.streaming = False
+        self.leaveWorkQueue()
+        self.stopPriorityOrder()
+
     def saveTagWithMainTag(self):
-        if self.listWidget.selectedItems():
+        if self.hasSelection():
             if self.mainTagComboBox.currentText():
-                mainTag = self.mainTagComboBox.currentText().title()
-                new_tag = f"{mainTag}{self.getSubTag()}"
-                self.metadata.loc[self.img_idx, self.tag_col] = new_tag
-                self.metadata.to_csv(self.filename, sep=self._sep, index=False, header=False)
+                new_tag = make_tag(self.mainTagComboBox.currentText(), self.getSubTag())
+                self.saveTag(new_tag)
                 self.subTagLineEdit.setText("")
                 # self.subTagLineEdit.selectAll()
                 self.showNext()
 
     def saveTagWithSubTag(self):
-        if self.listWidget.selectedItems():
+        if self.hasSelection():
             mainTag = self.main_tag_false
             new_tag = f"{mainTag}{self.getSubTag()}"
-            self.metadata.loc[self.img_idx, self.tag_col] = new_tag
-            self.metadata.to_csv(self.filename, sep=self._sep, index=False, header=False)
+            self.saveTag(new_tag)
             self.subTagLineEdit.setText("")
             # self.subTagLineEdit.selectAll()
             self.showNext()
 
+    def tagSelected(self):
+        selection = self.gridView.selectionModel().selection()
+        if self.labels is None or selection.isEmpty():
+            return
+        view_rows = np.concatenate(
+            [np.arange(r.top(), r.bottom() + 1) for r in selection]
+        )
+        positions = np.unique(self.listModel.positions(view_rows))
+        new_tag = make_tag(self.mainTagComboBox.currentText(), self.getSubTag())
+        self.saveTags(positions, new_tag)
+        self.subTagLineEdit.setText("")
+        if self.hasSelection() and self.img_idx in positions:
+            self.tagText.setText(new_tag)
+        self.statusBar().showMessage(f"Tagged {len(positions)} images as '{new_tag}'", 3000)
+
     def setTag(self, main_tag_str: str, sub_tag_str: str):
-        if self.listWidget.selectedItems():
+        if self.hasSelection():
             self.mainTagComboBox.setCurrentIndex(
                 self.mainTagComboBox.findText(main_tag_str)
             )
@@ -348,7 +988,7 @@ class QImageViewer(QMainWindow):
 
 
     def setMainTagAsTrue(self):
-        if self.listWidget.selectedItems():
+        if self.hasSelection():
             self.subTagLineEdit.setText("")
             self.mainTagComboBox.setCurrentIndex(
                 self.mainTagComboBox.findText(self.main_tag_true)
@@ -359,7 +999,7 @@ class QImageViewer(QMainWindow):
             self.saveTagWithMainTag()
 
     def setMainTagAsFalse(self):
-        if self.listWidget.selectedItems():
+        if self.hasSelection():
             self.subTagLineEdit.setText("")
             self.mainTagComboBox.setCurrentIndex(
                 self.mainTagComboBox.findText(self.main_tag_false)
@@ -370,14 +1010,14 @@ class QImageViewer(QMainWindow):
             self.saveTagWithMainTag()
 
     # def setSubTagAsErr(self):
-    #     if self.listWidget.selectedItems():
+    #     if self.hasSelection():
     #         self.subTagComboBox.setCurrentIndex(
     #             self.mainTagComboBox.findText(self.sub_tag_err)
     #         )
     #         self.saveTag()
 
     # def setSubTagAsDiff(self):
-    #     if self.listWidget.selectedItems():
+    #     if self.hasSelection():
     #         self.subTagComboBox.setCurrentIndex(
     #             self.mainTagComboBox.findText(self.sub_tag_diff)
     #         )
@@ -389,59 +1029,124 @@ class QImageViewer(QMainWindow):
         filename, _ = QFileDialog.getOpenFileName(self, 'QFileDialog.getOpenFileName()', '',
                                                   'Text Files (*.csv *.tsv *.txt)', options=options)
         if filename:
+            self.openList(filename)
+
+    def openList(self, filename, streaming=None):
+        """Open ``filename`` for tagging; it is streamed (see line_index) if
+        ``streaming`` is set or, by default, if it is over the size limit."""
+        self.closeJournal()
+        if streaming is None:
+            streaming = os.path.getsize(filename) > self.stream_above
+        with self.metrics.timer("open", filename):
+            self.labels = StreamingList(filename) if streaming else LabelList(filename)
+            self.streaming = streaming
             self.filename = filename
-            if filename.endswith("csv"):
-                self._sep = ","
-                self.metadata = pd.read_csv(filename, sep=self._sep, header=None)
-            else:
-                self._sep = "\t"
-                self.metadata = pd.read_csv(filename, sep=self._sep, header=None)
-
-            if self.metadata.shape[1] == 3:
-                self.metadata.columns = self.origin_cols
-                self.metadata["tag"] = None
-                self.metadata = self.metadata.loc[:, self.tagged_cols]
-            elif self.metadata.shape[1] == 4:
-                self.metadata.columns = self.tagged_cols
-            else:
-                raise ValueError("Data File Column shoud be one of {3, 4}")
-
+            self.metadata = self.labels.metadata
+            self.exportAct.setEnabled(True)
+            self.journalSyncTimer.start()
 
             self.img_idx = 0
+            self.view_row = 0
 
             ext_list = ["png", "jpg", "jpeg", "bmp", "gif"]
-            self.get_image_list(self.metadata[self.filename_col].to_list())
-
+            with self.metrics.timer("populate", filename):
+                self.get_image_list(self.labels)
+                self.resetFilter()
+            self.queueAct.setEnabled(not streaming)
+            self.priorityAct.setEnabled(not streaming)
+            self.duplicateGroups = None
+            self.propagateDuplicatesAct.setEnabled(False)
+            # images must be local to be hashed
+            self.findDuplicatesAct.setEnabled(self.image_source is None and not streaming)
+            self.compareAct.setEnabled(bool(self.labels.compare_cols))
+            self.imageStack.setCurrentWidget(
+                self.compareView if self.isComparing() else self.leftImageView
+            )
+            if streaming:
+                self.statusBar().showMessage(
+                    f"Streaming {len(self.labels)} rows from disk: filters, priority order, "
+                    "work queue and near-duplicates are off", 10000
+                )
+            elif self.queueAct.isChecked():
+                self.joinWorkQueue()
+            elif self.priorityAct.isChecked():
+                self.startPriorityOrder()
+
+
+    def closeEvent(self, event):
+        self.thumbnailLoader.shutdown()
+        self.imageLoader.shutdown()
+        # both loaders read through the same remote source, so it is closed
+        # only once neither of them can open a connection again
+        if self.image_source is not None:
+            self.image_source.close()
+        self.closeJournal()
+        super().closeEvent(event)
 
     def print_(self):
+        from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
+
+        # the label only holds a downsampled copy
+        local_path = (self.imageLoader.localPath(self.current_image_filename)
+                      if self.current_image_filename is not None else None)
+        if local_path is None:
+            return
+        if self.printer is None:
+            self.printer = QPrinter()
         dialog = QPrintDialog(self.printer, self)
         if dialog.exec_():
+            pixmap = QPixmap(local_path)
             painter = QPainter(self.printer)
             rect = painter.viewport()
-            size = self.imageLabel.pixmap().size()
+            size = pixmap.size()
             size.scale(rect.size(), Qt.KeepAspectRatio)
             painter.setViewport(rect.x(), rect.y(), size.width(), size.height())
-            painter.setWindow(self.imageLabel.pixmap().rect())
-            painter.drawPixmap(0, 0, self.imageLabel.pixmap())
+            painter.setWindow(pixmap.rect())
+            painter.drawPixmap(0, 0, pixmap)
 
     def zoomIn(self):
-        self.scaleImage(1.25)
+        if self.isComparing():
+            self.compareView.zoomBy(1.25)
+        else:
+            self.scaleImage(1.25)
 
     def zoomOut(self):
-        self.scaleImage(0.8)
+        if self.isComparing():
+            self.compareView.zoomBy(0.8)
+        else:
+            self.scaleImage(0.8)
 
     def normalSize(self):
-        self.imageLabel.adjustSize()
+        if self.isComparing():
+            self.compareView.actualSize()
+            return
         self.scaleFactor = 1.0
+        self.imageLabel.resize(self.imageSize)
+        self.requestImage(None)
 
     def fitToWindow(self):
+        if self.isComparing():
+            # the panes have no scroll bars: fitting resets the shared zoom,
+            # the check state applies once back to the single image
+            self.compareView.reset()
+            return
         fitToWindow = self.fitToWindowAct.isChecked()
         self.leftImageView.setWidgetResizable(fitToWindow)
-        if not fitToWindow:
+        if fitToWindow:
+            self.requestImage(self.viewportTarget())
+        else:
             self.normalSize()
 
         self.updateActions()
 
+    def showStats(self):
+        from stats_dialog import SessionStatsDialog
+
+        if self.statsDialog is None:
+            self.statsDialog = SessionStatsDialog(self.metrics, self)
+        self.statsDialog.show()
+        self.statsDialog.raise_()
+
     def about(self):
         QMessageBox.about(self, "About Image Viewer",
                           "<p>The <b>Image Viewer</b> example shows how to combine "
@@ -470,16 +1175,24 @@ class QImageViewer(QMainWindow):
             triggered=self.showNext,
         )
         self.openAct = QAction("&Open...", self, shortcut=QKeySequence("Ctrl+O"), triggered=self.open)
+        self.exportAct = QAction("&Export", self, shortcut="Ctrl+E", enabled=False, triggered=self.exportList)
+        self.queueAct = QAction("Share via Work &Queue", self, enabled=False, checkable=True, triggered=self.toggleWorkQueue)
         self.printAct = QAction("&Print...", self, enabled=False, triggered=self.print_)
         self.exitAct = QAction("E&xit", self, shortcut="Ctrl+Q", triggered=self.close)
         self.zoomInAct = QAction("Zoom &In (25%)", self, shortcut="Ctrl++", enabled=False, triggered=self.zoomIn)
         self.zoomOutAct = QAction("Zoom &Out (25%)", self, shortcut="Ctrl+-", enabled=False, triggered=self.zoomOut)
         self.normalSizeAct = QAction("&Normal Size", self, shortcut="Ctrl+S", enabled=False, triggered=self.normalSize)
+        self.priorityAct = QAction("&Priority Order", self, enabled=False, checkable=True, triggered=self.togglePriorityOrder)
+        self.compareAct = QAction("&Compare", self, shortcut="Ctrl+K", enabled=False, checkable=True, triggered=self.toggleCompare)
         self.fitToWindowAct = QAction("&Fit to Window", self, shortcut="Ctrl+W", enabled=False, checkable=True, triggered=self.fitToWindow)
+        self.statsAct = QAction("Session &Stats...", self, triggered=self.showStats)
         self.aboutAct = QAction("&About", self, triggered=self.about)
         self.aboutQtAct = QAction("About &Qt", self, triggered=qApp.aboutQt)
         self.mainTagAsTrueAct = QAction(f"Set Main Tag to '{self.main_tag_true}'", self, shortcut="Ctrl+Shift+T", triggered=self.setMainTagAsTrue)
         self.mainTagAsFalseAct = QAction(f"Set Main Tag to '{self.main_tag_false}'", self, shortcut="Ctrl+Shift+F", triggered=self.setMainTagAsFalse)
+        self.tagSelectedAct = QAction("Tag &Selected Thumbnails", self, shortcut="Ctrl+G", triggered=self.tagSelected)
+        self.findDuplicatesAct = QAction("Find &Near-Duplicates", self, enabled=False, triggered=self.findDuplicates)
+        self.propagateDuplicatesAct = QAction("Tag Near-Duplicates &Too", self, enabled=False, checkable=True)
 
         # self.subTagAsErrAct = QAction(f"Set Main Tag to '{self.sub_tag_err}'", self, shortcut="Ctrl+E", triggered=self.setSubTagAsErr)
         # self.subTagAsDiffAct = QAction(f"Set Main Tag to '{self.sub_tag_diff}'", self, shortcut="Ctrl+D", triggered=self.setSubTagAsDiff)
@@ -495,6 +1208,8 @@ class QImageViewer(QMainWindow):
     def createMenus(self):
         self.fileMenu = QMenu("&File", self)
         self.fileMenu.addAction(self.openAct)
+        self.fileMenu.addAction(self.exportAct)
+        self.fileMenu.addAction(self.queueAct)
         self.fileMenu.addAction(self.printAct)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.exitAct)
@@ -502,6 +1217,10 @@ class QImageViewer(QMainWindow):
         self.editMenu = QMenu("&Edit", self)
         self.editMenu.addAction(self.mainTagAsTrueAct)
         self.editMenu.addAction(self.mainTagAsFalseAct)
+        self.editMenu.addAction(self.tagSelectedAct)
+        self.editMenu.addSeparator()
+        self.editMenu.addAction(self.findDuplicatesAct)
+        self.editMenu.addAction(self.propagateDuplicatesAct)
         # self.editMenu.addSeparator()
         # self.editMenu.addAction(self.subTagAsErrAct)
         # self.editMenu.addAction(self.subTagAsDiffAct)
@@ -511,6 +1230,8 @@ class QImageViewer(QMainWindow):
         self.viewMenu = QMenu("&View", self)
         self.viewMenu.addAction(self.showPreviousAct)
         self.viewMenu.addAction(self.showNextAct)
+        self.viewMenu.addAction(self.priorityAct)
+        self.viewMenu.addAction(self.compareAct)
 
         self.viewMenu.addSeparator()
         self.viewMenu.addAction(self.zoomInAct)
@@ -518,6 +1239,8 @@ class QImageViewer(QMainWindow):
         self.viewMenu.addAction(self.normalSizeAct)
         self.viewMenu.addSeparator()
         self.viewMenu.addAction(self.fitToWindowAct)
+        self.viewMenu.addSeparator()
+        self.viewMenu.addAction(self.statsAct)
 
         self.helpMenu = QMenu("&Help", self)
         self.helpMenu.addAction(self.aboutAct)
@@ -529,13 +1252,15 @@ class QImageViewer(QMainWindow):
         self.menuBar().addMenu(self.helpMenu)
 
     def updateActions(self):
-        self.zoomInAct.setEnabled(not self.fitToWindowAct.isChecked())
-        self.zoomOutAct.setEnabled(not self.fitToWindowAct.isChecked())
-        self.normalSizeAct.setEnabled(not self.fitToWindowAct.isChecked())
+        zoomable = self.isComparing() or not self.fitToWindowAct.isChecked()
+        self.zoomInAct.setEnabled(zoomable)
+        self.zoomOutAct.setEnabled(zoomable)
+        self.normalSizeAct.setEnabled(zoomable)
 
     def scaleImage(self, factor):
         self.scaleFactor *= factor
-        self.imageLabel.resize(self.scaleFactor * self.imageLabel.pixmap().size())
+        self.imageLabel.resize(self.scaleFactor * self.imageSize)
+        self.requestImage(self.displayTarget())
 
         self.adjustScrollBar(self.leftImageView.horizontalScrollBar(), factor)
         self.adjustScrollBar(self.leftImageView.verticalScrollBar(), factor)
@@ -548,14 +1273,74 @@ class QImageViewer(QMainWindow):
                                + ((factor - 1) * scrollBar.pageStep() / 2)))
 
 
+# time from the start of viewer.py until the main window is first shown
+FIRST_WINDOW_TARGET_S = 0.8
+
+
+def report_startup_timing():
+    startup_timing.mark("first window shown")
+    startup_timing.uninstall()
+    startup_timing.report()
+    elapsed = startup_timing.marks[-1][1]
+    verdict = "ok" if elapsed <= FIRST_WINDOW_TARGET_S else "over target"
+    print(f"time to first window: {elapsed:.3f} s "
+          f"(target {FIRST_WINDOW_TARGET_S:.1f} s, {verdict})", file=sys.stderr)
+
+
 if __name__ == '__main__':
-    import sys
+    import argparse
     from PyQt5.QtWidgets import QApplication
 
-    app = QApplication(sys.argv)
-    imageViewer = QImageViewer()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-mb", type=int, default=512,
+                        help="memory budget of the decoded image cache (MB)")
+    parser.add_argument("--remote", metavar="[USER@]HOST[:PORT]",
+                        help="read the images in the list from this host over SFTP")
+    parser.add_argument("--remote-cache", default=os.path.expanduser("~/.cache/img_labeler"),
+                        help="directory of downloaded remote images")
+    parser.add_argument("--remote-cache-mb", type=int, default=4096,
+                        help="disk budget of downloaded remote images (MB)")
+    parser.add_argument("--remote-connections", type=int, default=4,
+                        help="concurrent SFTP sessions")
+    parser.add_argument("--thumbnail-cache",
+                        help="SQLite file of generated thumbnails "
+                             "(default: ~/.cache/img_labeler/thumbnails.sqlite)")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="print import and start-up times to stderr")
+    parser.add_argument("--stream-above-mb", type=int, default=2048,
+                        help="stream lists larger than this from disk instead of reading "
+                             "them into memory (MB)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write the session's latencies and labels/min to this "
+                             ".json (or .csv) file at exit")
+    args, qt_args = parser.parse_known_args()
+    if startup_timing is not None:
+        startup_timing.mark("imports")
+
+    image_source = None
+    if args.remote:
+        from remote_source import RemoteImageSource
+        image_source = RemoteImageSource(
+            args.remote, args.remote_cache, args.remote_cache_mb * 2**20,
+            connections=args.remote_connections,
+        )
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    if startup_timing is not None:
+        startup_timing.mark("QApplication")
+    imageViewer = QImageViewer(
+        cache_budget_mb=args.cache_mb, image_source=image_source,
+        thumbnail_cache=args.thumbnail_cache, stream_above_mb=args.stream_above_mb,
+    )
     imageViewer.show()
-    sys.exit(app.exec_())
+    if startup_timing is not None:
+        startup_timing.mark("window built")
+        # runs once the event loop has processed the first show/paint
+        QtCore.QTimer.singleShot(0, report_startup_timing)
+    status = app.exec_()
+    if args.metrics:
+        imageViewer.metrics.write(args.metrics)
+    sys.exit(status)
     # TODO QScrollArea support mouse
     # base on https://github.com/baoboa/pyqt5/blob/master/examples/widgets/imageviewer.py
     #
@@ -0,0 +1,169 @@
+import getpass
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+def default_owner() -> str:
+    return f"{getpass.getuser()}@{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """Shares the rows of one image list between several labelers.
+
+    Rows are handed out in blocks of ``block_size``: ``claim`` leases the
+    next block nobody else holds, for ``lease_seconds`` (``renew`` extends
+    it, leases of crashed labelers simply expire). Tags are recorded per
+    row with the labeler and time of the last write, so everyone sees the
+    others' tags through ``changes``. State lives in a WAL-mode SQLite file
+    next to the list (so all labelers must run on the same machine); every
+    operation is one short transaction.
+    """
+
+    def __init__(self, filename, rows: int, owner=None, block_size=32, lease_seconds=300):
+        self.path = self.path_for(filename)
+        self.rows = rows
+        self.owner = owner or default_owner()
+        self.block_size = block_size
+        self.lease_seconds = lease_seconds
+
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            self._setup(rows, block_size)
+        except BaseException:
+            self._conn.close()
+            raise
+
+    def _setup(self, rows: int, block_size: int):
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blocks ("
+                " block INTEGER PRIMARY KEY, owner TEXT,"
+                " expires REAL NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tags ("
+                " row INTEGER PRIMARY KEY, filename TEXT NOT NULL, tag TEXT,"
+                " writer TEXT NOT NULL, written_at REAL NOT NULL, version INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS tags_version ON tags (version)"
+            )
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+            if not meta:
+                self._conn.execute(
+                    "INSERT INTO meta VALUES ('rows', ?), ('block_size', ?), ('version', 0)",
+                    (rows, block_size),
+                )
+                blocks = -(-rows // block_size)
+                self._conn.executemany(
+                    "INSERT INTO blocks (block) VALUES (?)", ((b,) for b in range(blocks))
+                )
+            elif meta["rows"] != rows:
+                raise ValueError(
+                    f"{self.path} was made for {meta['rows']} rows, the list has {rows}"
+                )
+            else:
+                self.block_size = meta["block_size"]
+
+    @staticmethod
+    def path_for(filename) -> str:
+        return f"{filename}.queue.sqlite"
+
+    @contextmanager
+    def _transaction(self):
+        # take the write lock up front instead of failing to upgrade it
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def block_rows(self, block: int) -> range:
+        return range(block * self.block_size, min(self.rows, (block + 1) * self.block_size))
+
+    def claim(self):
+        """Lease the next open block nobody holds; returns its number, or
+        None once every block is done or leased."""
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT block FROM blocks"
+                " WHERE done = 0 AND (owner IS NULL OR expires < ?)"
+                " ORDER BY block LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE blocks SET owner = ?, expires = ? WHERE block = ?",
+                (self.owner, now + self.lease_seconds, row[0]),
+            )
+        return row[0]
+
+    def renew(self):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE blocks SET expires = ? WHERE owner = ? AND done = 0",
+                (time.time() + self.lease_seconds, self.owner),
+            )
+
+    def finish(self, block: int):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE blocks SET done = 1, owner = NULL WHERE block = ?", (block,)
+            )
+
+    def release(self):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE blocks SET owner = NULL, expires = 0 WHERE owner = ? AND done = 0",
+                (self.owner,),
+            )
+
+    def record(self, rows, filenames, tag):
+        now = time.time()
+        with self._transaction():
+            # every write gets the next version, so readers can ask for
+            # exactly what they have not seen yet
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            version = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO tags VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (row) DO UPDATE SET"
+                " filename = excluded.filename, tag = excluded.tag, writer = excluded.writer,"
+                " written_at = excluded.written_at, version = excluded.version",
+                ((int(row), filename, tag, self.owner, now, version)
+                 for row, filename in zip(rows, filenames)),
+            )
+
+    def changes(self, since=0):
+        """(row, filename, tag, writer, version) of the tags written after
+        version ``since``, oldest first."""
+        return self._conn.execute(
+            "SELECT row, filename, tag, writer, version FROM tags"
+            " WHERE version > ? ORDER BY version",
+            (since,),
+        ).fetchall()
+
+    def progress(self):
+        """(done blocks, leased blocks, all blocks)."""
+        return self._conn.execute(
+            "SELECT SUM(done), SUM(done = 0 AND owner IS NOT NULL AND expires >= ?),"
+            " COUNT(*) FROM blocks",
+            (time.time(),),
+        ).fetchone()
+
+    def close(self):
+        self.release()
+        self._conn.close()